@@ -1,13 +1,38 @@
-from sqlalchemy import create_engine
+import functools
+import json
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
 from auto_gpt_plugin_template import AutoGPTPluginTemplate
 from .planner import Planner
-from .database import DatabaseManager
+from .database import DatabaseManager, set_sqlite_pragmas
 from .models import Task, Plan
 from .tasks import TaskManager
 from typing import Any, Dict, List, Optional, Tuple, TypeVar, TypedDict
 
 PromptGenerator = TypeVar("PromptGenerator")
 
+_DATABASE_PATH = "autogpt_database.db"
+
+
+@functools.lru_cache(maxsize=None)
+def _get_engine(path):
+    """
+    Create the pooled engine for the given SQLite database file. The result is memoized, so every component
+    of the plugin shares one engine and connection pool per file instead of opening the file again.
+    """
+    engine = create_engine(
+        f"sqlite:///{path}",
+        poolclass=QueuePool,
+        pool_size=15,
+        max_overflow=5,
+        pool_timeout=30,
+        pool_recycle=1800,
+        pool_pre_ping=True,
+        connect_args={"check_same_thread": False},
+    )
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    return engine
+
 
 class Message(TypedDict):
     role: str
@@ -22,25 +47,50 @@ class AutoGPTPlannerPlugin(AutoGPTPluginTemplate):
 
     def __init__(self):
         """
-        Initialize the AutoGPTPlannerPlugin with a Planner, DatabaseManager, and TaskManager instances.
+        Initialize the AutoGPTPlannerPlugin. The Planner, DatabaseManager, and TaskManager instances are created
+        on first access, so hosts that only probe the can_handle methods never touch the database.
         """
         self._name = "AutoGPT-Planner-Plugin"
         self._version = "0.1.0"
         self._description = "This is a task planner plugin for Auto-GPT. It manages tasks and plans for the user."
 
-        # Initialize the database manager
-        database_name = "autogpt_database"  # Replace "your_database_name" with your desired database name
-        self.database_manager = DatabaseManager(database_name)
+        # Components backed by the shared engine, created lazily
+        self._database_manager = None
+        self._task_manager = None
+        self._planner = None
 
-        # Create the SQLAlchemy engine
-        db_path = f"sqlite:///autogpt_database.db"  # Replace "autogpt_database" with your desired database name
-        engine = create_engine(db_path)
+        # The plan generated in the current cycle, cached once the cycle completes
+        self._pending_plan = None
 
-        # Initialize the task manager with the engine
-        self.task_manager = TaskManager(engine)
+        # Result of get_tasks, invalidated whenever the tasks change
+        self._tasks_cache = None
 
-        # Initialize the planner with the engine
-        self.planner = Planner(engine, self.task_manager)
+    @property
+    def database_manager(self):
+        """
+        The DatabaseManager using the shared engine, created on first access.
+        """
+        if self._database_manager is None:
+            self._database_manager = DatabaseManager(_get_engine(_DATABASE_PATH))
+        return self._database_manager
+
+    @property
+    def task_manager(self):
+        """
+        The TaskManager using the shared engine, created on first access.
+        """
+        if self._task_manager is None:
+            self._task_manager = TaskManager(_get_engine(_DATABASE_PATH))
+        return self._task_manager
+
+    @property
+    def planner(self):
+        """
+        The Planner using the shared engine, task manager and database manager, created on first access.
+        """
+        if self._planner is None:
+            self._planner = Planner(_get_engine(_DATABASE_PATH), self.task_manager, self.database_manager)
+        return self._planner
 
     def can_handle_on_response(self) -> bool:
         """This method is called to check that the plugin can
@@ -66,28 +116,19 @@ class AutoGPTPlannerPlugin(AutoGPTPluginTemplate):
 
         The method performs the following steps:
 
-        1. Starts the planning cycle by calling the `start_planning_cycle` method of the `Planner` class.
-        This involves generating a new plan and task database, creating tasks based on the plan, and starting the execution of tasks.
-
-        2. Generates a new plan by calling the `generate_plan` method of the `Planner` class. The plan is saved to the database.
-
-        3. Generates tasks based on the current plan by calling the `generate_tasks` method of the `Planner` class. The tasks are saved to the database.
-
-        4. Retrieves all tasks from the database by calling the `get_all_tasks` method of the `DatabaseManager` class.
-
-        5. Iterates over the retrieved tasks. For each task, it performs the following actions:
-        - Retrieves the task ID.
-        - Executes the task by calling the `execute_task` method of the `TaskManager` class, passing the task ID as an argument.
-        - Marks the task as complete by calling the `mark_task_complete` method of the `TaskManager` class, passing the task ID as an argument.
-        - Retrieves the task based on its ID by calling the `get_task` method of the `TaskManager` class, passing the task ID as an argument.
+        1. Generates a new plan for the agent's goals, taken from the prompt generator, by calling the `generate_plan`
+        method of the `Planner` class. This step is skipped if the prompt has no goals.
 
-        6. Updates the current plan based on the completed tasks by calling the `update_plan` method of the `Planner` class.
+        2. Retrieves the incomplete tasks by calling the `get_incomplete_tasks` method of the `TaskManager` class.
 
-        7. Retrieves the current plan from the database by calling the `get_plan` method of the `Planner` class.
+        3. Solves those tasks in batched requests and marks them as complete by calling the `complete_tasks` method of
+        the `Planner` class, and adds their solutions to the prompt's resources.
 
-        8. Retrieves all tasks from the database by calling the `get_tasks` method of the `TaskManager` class.
+        4. Updates the goals of the plans whose tasks are now complete and caches the generated plan, by calling
+        `update_plan`, in a single transaction.
 
-        If any of the steps fail, an exception is raised and its message is printed to the console.
+        No database lock is held while waiting on the API: complete_tasks only opens its transaction once the tasks
+        are solved. If any of the steps fail, the exception message is printed to the console.
 
         Args:
             prompt (PromptGenerator): The prompt generator.
@@ -97,23 +138,19 @@ class AutoGPTPlannerPlugin(AutoGPTPluginTemplate):
         """
         # Call the methods here
         try:
-            self.start_planning_cycle()
-            self.generate_plan()
-            self.generate_tasks()  # Generate the tasks and store them in the database
+            self.generate_plan(list(getattr(prompt, "goals", None) or []))
 
-            # Retrieve all tasks from the database
-            tasks = self.database_manager.get_all_tasks()
+            # Solve the incomplete tasks in batched requests instead of one round-trip per task
+            tasks = self.task_manager.get_incomplete_tasks()
+            solutions = self.planner.complete_tasks(tasks)
+            self._tasks_cache = None
+            if hasattr(prompt, "add_resource"):
+                for task in tasks:
+                    if solutions.get(task.id):
+                        prompt.add_resource(f"Solution to the task '{task.description}': {solutions[task.id]}")
 
-            # Iterate over the tasks and use the task IDs
-            for task in tasks:
-                task_id = task.id  # Get the task ID
-                self.execute_task(task_id)
-                self.mark_task_complete(task_id)
-                self.get_task(task_id)
-
-            self.update_plan()
-            self.get_plan()
-            self.get_tasks()
+            with self.database_manager.engine.begin() as conn:
+                self.update_plan(conn=conn)
 
         except Exception as e:
             print(str(e))
@@ -288,3 +325,122 @@ class AutoGPTPlannerPlugin(AutoGPTPluginTemplate):
 
     def report(self, message: str) -> None:
         pass
+
+    def start_planning_cycle(self, goals):
+        """
+        Starts the planning cycle. This includes generating a new plan, creating tasks based on the plan,
+        and executing tasks based on their priority.
+
+        Args:
+            goals (List[str]): The goals to plan for.
+        """
+        self.planner.run_initial_planning_cycle(goals)
+
+    def generate_plan(self, goals=None):
+        """
+        Generates a new plan and saves it to the database. If a plan for a similar goal is found in the plan cache,
+        the planner adapts it instead of decomposing the goals from scratch. The goals are only embedded and compared
+        against the plan cache if the planner's in-memory caches can't answer.
+
+        Args:
+            goals (List[str]): The goals to plan for.
+
+        Returns:
+            str: The generated plan, or None if no goals were given.
+        """
+        self._pending_plan = None
+        if not goals:
+            return None
+        embedding = None
+
+        def find_similar_plan():
+            nonlocal embedding
+            embedding = self.planner.embed_goals(goals)
+            return self.database_manager.get_similar_plan(embedding)
+
+        plan = self.planner.generate_plan(goals, cached_plan=find_similar_plan)
+        # A plan answered from memory was generated, and cached by update_plan, in an earlier cycle
+        if embedding is not None:
+            self._pending_plan = (goals, embedding, plan)
+        return plan
+
+    def generate_tasks(self, plan=None, conn=None):
+        """
+        Generate tasks based on the current plan and save them to the database.
+
+        Args:
+            plan (list): The list of task dictionaries making up the plan.
+            conn (Connection, optional): An open connection whose transaction should be reused.
+        """
+        self._tasks_cache = None
+        self.planner.generate_tasks(plan, conn=conn)
+
+    def execute_task(self, task_id, conn=None):
+        """
+        Executes a task based on its ID, solving it and marking it as complete.
+
+        Args:
+            task_id (int): The ID of the task to execute.
+            conn (Connection, optional): An open connection to read the task with.
+
+        Returns:
+            str: The solution to the task, or None if it was solved by an earlier cycle.
+        """
+        self._tasks_cache = None
+        task = self.task_manager.get_task(task_id, conn=conn)
+        return self.planner.complete_tasks([task]).get(task_id)
+
+    def mark_task_complete(self, task_id, conn=None):
+        """
+        Marks a task as complete based on its ID.
+
+        Args:
+            task_id (int): The ID of the task to mark as complete.
+            conn (Connection, optional): An open connection whose transaction should be reused.
+        """
+        self._tasks_cache = None
+        self.task_manager.mark_task_complete(task_id, conn=conn)
+
+    def update_plan(self, conn=None):
+        """
+        Updates the current plan based on the completed tasks, marking the goals whose tasks are all complete.
+
+        Args:
+            conn (Connection, optional): An open connection whose transaction should be reused.
+        """
+        self.planner.update_goals(conn=conn)
+
+        # Cache the finished plan so similar goals can reuse it
+        if self._pending_plan is not None:
+            goals, embedding, plan = self._pending_plan
+            plan_json = json.dumps({"goals": goals, "plan": plan})
+            self.database_manager.cache_plan("\n".join(goals), embedding, plan_json, conn=conn)
+            self._pending_plan = None
+
+    def get_tasks(self, conn=None):
+        """
+        Retrieves all tasks from the database. The result is cached until the tasks change.
+
+        Args:
+            conn (Connection, optional): An open connection whose transaction should be reused.
+
+        Returns:
+            List[Task]: A list of all tasks.
+        """
+        if self._tasks_cache is not None:
+            return self._tasks_cache
+        self._tasks_cache = self.task_manager.get_all_tasks(conn=conn)
+        return self._tasks_cache
+
+    def get_task(self, task_id, conn=None):
+        """
+        Retrieve a task based on its ID.
+
+        Args:
+            task_id (int): The ID of the task to be retrieved.
+            conn (Connection, optional): An open connection whose transaction should be reused.
+
+        Returns:
+            Task: The retrieved task.
+        """
+        return self.task_manager.get_task(task_id, conn=conn)
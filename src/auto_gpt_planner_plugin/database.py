@@ -1,7 +1,19 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean
-from sqlalchemy.orm import sessionmaker, scoped_session
+import hashlib
+import threading
+import weakref
+from contextlib import contextmanager
+from functools import cached_property
+import numpy as np
+from cachetools import LFUCache
+from sqlalchemy import create_engine, delete, event, func, inspect, insert, lambda_stmt, select, update, DDL, CheckConstraint, Column, ForeignKey, Index, Integer, SmallInteger, String, Boolean, LargeBinary, Text
+from sqlalchemy.orm import Session, sessionmaker, scoped_session
 from sqlalchemy.ext.declarative import declarative_base
 
+try:
+    from pybloom_live import ScalableBloomFilter
+except ImportError:
+    ScalableBloomFilter = None
+
 Base = declarative_base()
 
 # Define the Task model
@@ -10,7 +22,24 @@ class Task(Base):
     id = Column(Integer, primary_key=True)
     description = Column(String)
     priority = Column(Integer)
-    completed = Column(Boolean)
+    # Stored as a plain 0/1 integer so rows are read without per-row bool conversion
+    completed = Column(SmallInteger, CheckConstraint('completed IN (0, 1)'), server_default='0', nullable=False)
+    plan_id = Column(Integer, ForeignKey('plans.id'))
+    goal_id = Column(Integer)
+    __table_args__ = (
+        # Covers the per-plan completion check in update_goals
+        Index('ix_task_plan_completed', 'plan_id', 'completed'),
+        # Lets the highest-priority and incomplete-task lookups walk only the incomplete tasks, already ordered by
+        # priority. Completed tasks are left out of the index on PostgreSQL and SQLite, which support partial indexes
+        Index(
+            'ix_tasks_incomplete', priority.desc(),
+            postgresql_where=completed == 0, sqlite_where=completed == 0,
+        ),
+        # Lets complete_tasks_for_goal find a goal's tasks without scanning the table
+        Index('ix_tasks_goal_id', 'goal_id'),
+        # On MySQL, store the small rows in InnoDB's compact format
+        {'mysql_engine': 'InnoDB', 'mysql_row_format': 'DYNAMIC'},
+    )
 
 # Define the Plan model
 class Plan(Base):
@@ -19,23 +48,263 @@ class Plan(Base):
     goal = Column(String)
     completed = Column(Boolean)
 
+# Define the PlanCache model
+class PlanCache(Base):
+    __tablename__ = 'plan_cache'
+    goal_hash = Column(String, primary_key=True)
+    embedding = Column(LargeBinary)
+    plan_json = Column(Text)
+    hits = Column(Integer, default=0)
+
+# Define the CompletedTask model: signatures of tasks that have already been solved
+class CompletedTask(Base):
+    __tablename__ = 'completed_tasks'
+    task_sig = Column(String, primary_key=True)
+
+# Define the DirtyPlan model: plans whose tasks changed since the last update_goals run
+class DirtyPlan(Base):
+    __tablename__ = 'dirty_plans'
+    plan_id = Column(Integer, primary_key=True)
+
+# On SQLite, triggers record every plan whose tasks change, whichever component writes them. They skip plans that
+# are already recorded with NOT EXISTS rather than INSERT OR IGNORE, since an enclosing UPSERT's conflict clause
+# overrides the conflict resolution of the statements in its triggers.
+def _mark_dirty(plan_id):
+    return (f"INSERT INTO dirty_plans (plan_id) SELECT {plan_id} WHERE {plan_id} IS NOT NULL "
+            f"AND NOT EXISTS (SELECT 1 FROM dirty_plans WHERE plan_id = {plan_id});")
+
+_DIRTY_PLAN_TRIGGERS = {
+    "tr_tasks_insert_dirty": f"AFTER INSERT ON tasks BEGIN {_mark_dirty('NEW.plan_id')} END",
+    "tr_tasks_update_dirty": (f"AFTER UPDATE OF completed, plan_id ON tasks "
+                              f"BEGIN {_mark_dirty('NEW.plan_id')} {_mark_dirty('OLD.plan_id')} END"),
+    "tr_tasks_delete_dirty": f"AFTER DELETE ON tasks BEGIN {_mark_dirty('OLD.plan_id')} END",
+    "tr_plans_insert_dirty": f"AFTER INSERT ON plans BEGIN {_mark_dirty('NEW.id')} END",
+}
+# Every existing plan starts out dirty when the table is first created
+event.listen(
+    DirtyPlan.__table__,
+    "after_create",
+    DDL("INSERT OR IGNORE INTO dirty_plans (plan_id) SELECT id FROM plans").execute_if(dialect="sqlite"),
+)
+# The triggers are recreated whenever the schema is set up, so databases created with older versions of them
+# are brought up to date
+for _name, _body in _DIRTY_PLAN_TRIGGERS.items():
+    event.listen(Base.metadata, "after_create", DDL(f"DROP TRIGGER IF EXISTS {_name}").execute_if(dialect="sqlite"))
+    event.listen(Base.metadata, "after_create", DDL(f"CREATE TRIGGER {_name} {_body}").execute_if(dialect="sqlite"))
+
+def task_signature(description, priority):
+    """
+    Identify a task by its content, so the same task generated again in a later cycle maps to the same signature.
+    The fields are joined with a unit separator so that e.g. ("step 1", 2) and ("step ", 12) don't collide.
+    """
+    return hashlib.sha256(f"{description}\x1f{priority}".encode("utf-8")).hexdigest()
+
+# Signatures per IN query, kept below SQLite's default limit of 999 bound parameters
+_SIGNATURE_BATCH_SIZE = 500
+
+# Leading keywords of textual SQL statements that write rows
+_WRITE_KEYWORDS = ("INSERT", "UPDATE", "DELETE", "REPLACE", "UPSERT", "MERGE")
+
+def statement_writes_table(context, statement, table_name):
+    """
+    Tell whether an executed statement may have written to the given table. Textual SQL is assumed to have written
+    to it if it writes at all, since its target table isn't known.
+    """
+    if context.isinsert or context.isupdate or context.isdelete:
+        table = getattr(getattr(context.compiled, "statement", None), "table", None)
+        if table is not None:
+            return table.name == table_name
+    return statement.lstrip().upper().startswith(_WRITE_KEYWORDS)
+
+def add_missing_columns(engine, table):
+    """
+    Add the columns of the given table that are missing from its existing database table, since create_all
+    only creates tables that don't exist yet.
+    """
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    missing = [column for column in table.columns if column.name not in existing]
+    if missing:
+        with engine.begin() as conn:
+            for column in missing:
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Tune a new SQLite connection for the plugin's write-heavy workload: WAL journaling so readers don't block
+    the writer, synchronous=NORMAL so commits only fsync at checkpoints, and a larger in-memory page cache.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-64000")
+    cursor.close()
+
+# Engines whose schema this process has already set up, so later managers skip the DDL inspection. Keyed by engine
+# rather than URL, since separate in-memory SQLite engines share the same URL.
+_initialized_engines = weakref.WeakSet()
+_initialized_lock = threading.Lock()
+
+def ensure_schema(engine):
+    """
+    Create the plugin's tables, and any columns and indexes missing from existing ones, and register the SQLite
+    pragmas, once per engine per process.
+    """
+    with _initialized_lock:
+        if engine in _initialized_engines:
+            return
+        # WAL and synchronous=NORMAL for file-backed SQLite databases; in-memory databases can't use WAL
+        is_file_sqlite = engine.dialect.name == "sqlite" and engine.url.database not in (None, "", ":memory:")
+        if is_file_sqlite and not event.contains(engine, "connect", set_sqlite_pragmas):
+            event.listen(engine, "connect", set_sqlite_pragmas)
+        Base.metadata.create_all(engine)
+        add_missing_columns(engine, Task.__table__)
+        # create_all only indexes new tables, so add any missing indexes to existing ones
+        for index in Task.__table__.indexes:
+            index.create(engine, checkfirst=True)
+        _initialized_engines.add(engine)
+
+# Tables whose writes are reported to the caches watching them
+_WATCHED_TABLES = ("tasks", "plans")
+# The objects watching each engine's writes, see watch_table_writes
+_write_watchers = weakref.WeakKeyDictionary()
+
+def watch_table_writes(engine, watcher):
+    """
+    Call watcher._invalidate(tables) with the set of watched tables after every statement on the engine that may
+    write to them, whichever component issues it, and again once its transaction is committed or rolled back,
+    since reads on other connections only see the writes from then on. The watcher is held weakly.
+    """
+    _write_watchers.setdefault(engine, weakref.WeakSet()).add(watcher)
+    if not event.contains(engine, "after_cursor_execute", _record_write):
+        event.listen(engine, "after_cursor_execute", _record_write)
+        event.listen(engine, "commit", _end_writes)
+        event.listen(engine, "rollback", _end_writes)
+
+def _notify_writes(engine, tables):
+    """
+    Report writes to the given tables to every watcher of the engine.
+    """
+    for watcher in list(_write_watchers.get(engine, ())):
+        watcher._invalidate(tables)
+
+def _record_write(conn, cursor, statement, parameters, context, executemany):
+    """
+    Note a write to a watched table on the connection and report it, so lookups already in flight don't cache what
+    they read.
+    """
+    tables = {name for name in _WATCHED_TABLES if statement_writes_table(context, statement, name)}
+    if tables:
+        conn.info.setdefault("written_tables", set()).update(tables)
+        _notify_writes(conn.engine, tables)
+
+def _end_writes(conn):
+    """
+    Report the connection's writes again once they are committed or rolled back, dropping rows that were read and
+    cached while the transaction was still open.
+    """
+    tables = conn.info.pop("written_tables", None)
+    if tables:
+        _notify_writes(conn.engine, tables)
+
 # DatabaseManager class
 class DatabaseManager:
     """
     The DatabaseManager class is responsible for managing the SQL databases. It interacts with the SQLAlchemy ORM to create, update, and retrieve data from the databases.
     """
-    def __init__(self, engine):
+    def __init__(self, engine, cache_size=256):
         """
         Initialize a new DatabaseManager instance.
         Args:
             engine (Engine): The SQLAlchemy engine instance.
+            cache_size (int): The maximum number of tasks and of plans kept in the in-memory lookup caches.
         """
         try:
-            Base.metadata.create_all(engine)
-            self.Session = scoped_session(sessionmaker(bind=engine))
+            self.engine = engine
+            ensure_schema(engine)
+            # One session per thread; objects stay usable after the session that loaded them is closed
+            self.Session = scoped_session(
+                sessionmaker(bind=engine, expire_on_commit=False), scopefunc=threading.get_ident
+            )
+            # Dirty plans are tracked by SQLite triggers; other databases re-check every plan
+            self._track_dirty_plans = engine.dialect.name == "sqlite"
+            # Least-frequently-used caches for get_task/get_plan, cleared by every write to their tables, whichever
+            # component issues it. A lookup only caches its row if no write happened while it was reading.
+            self._task_cache = LFUCache(maxsize=cache_size)
+            self._plan_cache = LFUCache(maxsize=cache_size)
+            self._cache_lock = threading.Lock()
+            self._cache_generation = 0
+            watch_table_writes(engine, self)
         except Exception as e:
             raise Exception("Failed to initialize DatabaseManager: " + str(e))
 
+    @cached_property
+    def _solved_filter(self):
+        """
+        The signatures of every solved task, held in a bloom filter when pybloom_live is installed. It is loaded from
+        the completed_tasks table on first use rather than whenever a DatabaseManager is created.
+        """
+        if ScalableBloomFilter is not None:
+            solved_filter = ScalableBloomFilter(initial_capacity=10_000, error_rate=1e-4)
+        else:
+            solved_filter = set()
+        with self.Session() as session:
+            for task_sig in session.execute(select(CompletedTask.task_sig)).scalars():
+                solved_filter.add(task_sig)
+        return solved_filter
+
+    @contextmanager
+    def _session(self, conn=None):
+        """
+        Yield a session that commits in its own transaction, or one that joins the transaction of the given connection.
+        Args:
+            conn (Connection, optional): An open connection whose transaction should be reused.
+        """
+        if conn is None:
+            with self.Session() as session, session.begin():
+                yield session
+        else:
+            with Session(bind=conn) as session:
+                yield session
+                session.flush()
+
+    def _invalidate(self, tables):
+        """
+        Clear the lookup caches of the given tables after they have been written.
+        Args:
+            tables (Set[str]): The names of the written tables.
+        """
+        with self._cache_lock:
+            self._cache_generation += 1
+            if "tasks" in tables:
+                self._task_cache.clear()
+            if "plans" in tables:
+                self._plan_cache.clear()
+
+    def _cache_lookup(self, cache, key):
+        """
+        Look up a cached row, returning it with the cache generation to pass to _cache_store.
+        """
+        with self._cache_lock:
+            return cache.get(key), self._cache_generation
+
+    def _cache_store(self, cache, key, value, generation):
+        """
+        Cache a row read from the database, unless its table was written since the lookup began.
+        """
+        with self._cache_lock:
+            if generation == self._cache_generation:
+                cache[key] = value
+
+    @staticmethod
+    def _column_values(instance):
+        """
+        Copy the column values of a loaded row, to be cached in place of the shared ORM instance.
+        """
+        return {attr.key: getattr(instance, attr.key) for attr in inspect(instance).mapper.column_attrs}
+
     def create_task(self, task):
         """
         Create a new task in the database.
@@ -43,9 +312,8 @@ class DatabaseManager:
             task (Task): The task to be added to the database.
         """
         try:
-            session = self.Session()
-            session.add(task)
-            session.commit()
+            with self.Session() as session, session.begin():
+                session.add(task)
         except Exception as e:
             raise Exception("Failed to create task: " + str(e))
 
@@ -55,14 +323,43 @@ class DatabaseManager:
         Args:
             task_id (int): The ID of the task to be retrieved.
         Returns:
-            Task: The retrieved task.
+            Task: A detached copy of the retrieved task. Changing it doesn't affect the cache or the database.
         """
+        # Cache the column values and hand out a new instance each time, so callers can't change the cached row
+        values, generation = self._cache_lookup(self._task_cache, task_id)
+        if values is not None:
+            return Task(**values)
         try:
-            session = self.Session()
-            task = session.query(Task).filter_by(id=task_id).first()
-            return task
+            with self.Session() as session, session.begin():
+                # The lambda caches the compiled statement; task_id is extracted as a bound parameter
+                stmt = lambda_stmt(lambda: select(Task).where(Task.id == task_id))
+                task = session.execute(stmt).scalar_one_or_none()
         except Exception as e:
             raise Exception("Failed to get task: " + str(e))
+        if task is None:
+            return None
+        values = self._column_values(task)
+        self._cache_store(self._task_cache, task_id, values, generation)
+        return Task(**values)
+
+    def get_all_task_ids(self, conn=None):
+        """
+        Retrieve the IDs of all tasks without loading the full Task rows.
+        Args:
+            conn (Connection, optional): An open connection whose transaction should be reused.
+        Returns:
+            List[int]: The IDs of all tasks.
+        """
+        try:
+            stmt = lambda_stmt(lambda: select(Task.id))
+            if conn is None:
+                with self.engine.connect() as conn:
+                    rows = conn.execute(stmt).all()
+            else:
+                rows = conn.execute(stmt).all()
+            return [row[0] for row in rows]
+        except Exception as e:
+            raise Exception("Failed to get task IDs: " + str(e))
 
     def update_task(self, task):
         """
@@ -71,9 +368,15 @@ class DatabaseManager:
             task (Task): The task to be updated in the database.
         """
         try:
-            session = self.Session()
-            session.merge(task)
-            session.commit()
+            with self.Session() as session, session.begin():
+                session.execute(
+                    update(Task).where(Task.id == task.id).values(
+                        description=task.description,
+                        priority=task.priority,
+                        completed=task.completed,
+                        plan_id=task.plan_id,
+                    )
+                )
         except Exception as e:
             raise Exception("Failed to update task: " + str(e))
 
@@ -84,10 +387,8 @@ class DatabaseManager:
             task_id (int): The ID of the task to be deleted.
         """
         try:
-            session = self.Session()
-            task = session.query(Task).filter_by(id=task_id).first()
-            session.delete(task)
-            session.commit()
+            with self.Session() as session, session.begin():
+                session.execute(delete(Task).where(Task.id == task_id))
         except Exception as e:
             raise Exception("Failed to delete task: " + str(e))
 
@@ -98,9 +399,8 @@ class DatabaseManager:
             plan (Plan): The plan to be added to the database.
         """
         try:
-            session = self.Session()
-            session.add(plan)
-            session.commit()
+            with self.Session() as session, session.begin():
+                session.add(plan)
         except Exception as e:
             raise Exception("Failed to create plan: " + str(e))
 
@@ -110,14 +410,22 @@ class DatabaseManager:
         Args:
             plan_id (int): The ID of the plan to be retrieved.
         Returns:
-            Plan: The retrieved plan.
+            Plan: A detached copy of the retrieved plan. Changing it doesn't affect the cache or the database.
         """
+        values, generation = self._cache_lookup(self._plan_cache, plan_id)
+        if values is not None:
+            return Plan(**values)
         try:
-            session = self.Session()
-            plan = session.query(Plan).filter_by(id=plan_id).first()
-            return plan
+            with self.Session() as session, session.begin():
+                stmt = lambda_stmt(lambda: select(Plan).where(Plan.id == plan_id))
+                plan = session.execute(stmt).scalar_one_or_none()
         except Exception as e:
             raise Exception("Failed to get plan: " + str(e))
+        if plan is None:
+            return None
+        values = self._column_values(plan)
+        self._cache_store(self._plan_cache, plan_id, values, generation)
+        return Plan(**values)
 
     def update_plan(self, plan):
         """
@@ -126,9 +434,10 @@ class DatabaseManager:
             plan (Plan): The plan to be updated in the database.
         """
         try:
-            session = self.Session()
-            session.merge(plan)
-            session.commit()
+            with self.Session() as session, session.begin():
+                session.execute(
+                    update(Plan).where(Plan.id == plan.id).values(goal=plan.goal, completed=plan.completed)
+                )
         except Exception as e:
             raise Exception("Failed to update plan: " + str(e))
 
@@ -140,11 +449,8 @@ class DatabaseManager:
             plan_id (int): The ID of the plan to be deleted.
         """
         try:
-            session = self.Session()
-            plan = session.query(Plan).filter_by(id=plan_id).first()
-            if plan:
-                session.delete(plan)
-                session.commit()
+            with self.Session() as session, session.begin():
+                session.execute(delete(Plan).where(Plan.id == plan_id))
         except Exception as e:
             raise Exception("Failed to delete plan: " + str(e))
 
@@ -154,13 +460,14 @@ class DatabaseManager:
 
         Args:
             task_id (int): The ID of the task to be marked as complete.
+
+        Returns:
+            bool: True if the task was found and updated, False if it does not exist.
         """
         try:
-            session = self.Session()
-            task = session.query(Task).filter_by(id=task_id).first()
-            if task:
-                task.completed = True
-                session.commit()
+            with self.Session() as session, session.begin():
+                result = session.execute(update(Task).where(Task.id == task_id).values(completed=1))
+            return result.rowcount == 1
         except Exception as e:
             raise Exception("Failed to mark task complete: " + str(e))
 
@@ -170,30 +477,150 @@ class DatabaseManager:
 
         Args:
             goal (str): The goal to be marked as complete.
+
+        Returns:
+            bool: True if a plan with the goal was found and updated, False if none exists.
         """
         try:
-            session = self.Session()
-            plan = session.query(Plan).filter_by(goal=goal).first()
-            if plan:
-                plan.completed = True
-                session.commit()
+            with self.Session() as session, session.begin():
+                result = session.execute(update(Plan).where(Plan.goal == goal).values(completed=True))
+            return result.rowcount > 0
         except Exception as e:
             raise Exception("Failed to mark goal complete: " + str(e))
 
-    def update_goals(self):
+    def update_goals(self, conn=None):
         """
         Updates the goals to complete the overall goal. This could involve changing the status of the goal, adding new tasks, or other updates as needed.
+        Only plans whose tasks changed since the last run are re-checked.
+
+        Args:
+            conn (Connection, optional): An open connection whose transaction should be reused.
+
+        Returns:
+            int: The number of plans that were marked as completed.
+        """
+        try:
+            with self._session(conn) as session:
+                # Plans that still have at least one incomplete task; completed is NOT NULL, so != covers every row
+                incomplete_plan_ids = session.query(Task.plan_id).filter(
+                    Task.plan_id.isnot(None), Task.completed != 1
+                )
+                plans = session.query(Plan).filter(~Plan.id.in_(incomplete_plan_ids), Plan.completed.isnot(True))
+                if self._track_dirty_plans:
+                    plans = plans.filter(Plan.id.in_(session.query(DirtyPlan.plan_id)))
+                # Mark every other plan as completed with a single UPDATE
+                updated = plans.update({Plan.completed: True}, synchronize_session=False)
+                if self._track_dirty_plans:
+                    session.query(DirtyPlan).delete(synchronize_session=False)
+                return updated
+        except Exception as e:
+            raise Exception("Failed to update goals: " + str(e))
+
+    def get_similar_plan(self, embedding, threshold=0.90):
+        """
+        Retrieve the cached plan whose goal embedding is most similar to the given one.
+
+        Args:
+            embedding (numpy.ndarray): The embedding of the current goal.
+            threshold (float): The minimum cosine similarity for a cached plan to be reused.
+
+        Returns:
+            str: The cached plan JSON, or None if no cached plan is similar enough.
+        """
+        try:
+            with self.Session() as session, session.begin():
+                # Only the embeddings are scanned; the plan of the best match is loaded on its own
+                entries = session.execute(select(PlanCache.goal_hash, PlanCache.embedding)).all()
+                if not entries:
+                    return None
+                matrix = np.stack([np.frombuffer(entry.embedding, dtype=np.float32) for entry in entries])
+                query = np.asarray(embedding, dtype=np.float32)
+                norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+                similarities = (matrix @ query) / np.where(norms == 0, 1, norms)
+                best = int(np.argmax(similarities))
+                if similarities[best] < threshold:
+                    return None
+                goal_hash = entries[best].goal_hash
+                session.execute(
+                    update(PlanCache).where(PlanCache.goal_hash == goal_hash)
+                    .values(hits=func.coalesce(PlanCache.hits, 0) + 1)
+                )
+                return session.execute(select(PlanCache.plan_json).where(PlanCache.goal_hash == goal_hash)).scalar_one()
+        except Exception as e:
+            raise Exception("Failed to get similar plan: " + str(e))
+
+    def solved_signatures(self, task_sigs):
+        """
+        Find which of the given task signatures have already been solved.
+
+        Args:
+            task_sigs (Iterable[str]): The signatures of the tasks.
+
+        Returns:
+            set: The signatures of the tasks that have been solved before.
+        """
+        candidates = [task_sig for task_sig in set(task_sigs) if task_sig in self._solved_filter]
+        if ScalableBloomFilter is None or not candidates:
+            return set(candidates)
+        # The bloom filter can report false positives, so confirm the hits against the table, one query per batch
+        solved = set()
+        try:
+            with self.Session() as session:
+                for start in range(0, len(candidates), _SIGNATURE_BATCH_SIZE):
+                    batch = candidates[start:start + _SIGNATURE_BATCH_SIZE]
+                    solved.update(session.execute(
+                        select(CompletedTask.task_sig).where(CompletedTask.task_sig.in_(batch))
+                    ).scalars())
+        except Exception as e:
+            raise Exception("Failed to check solved tasks: " + str(e))
+        return solved
+
+    def record_solved_tasks(self, task_sigs, conn=None):
+        """
+        Record the signatures of solved tasks so they are skipped by later planning cycles.
+
+        Args:
+            task_sigs (List[str]): The signatures of the solved tasks.
+            conn (Connection, optional): An open connection whose transaction should be reused.
+        """
+        task_sigs = set(task_sigs)
+        if not task_sigs:
+            return
+        try:
+            with self._session(conn) as session:
+                ordered = list(task_sigs)
+                existing = set()
+                for start in range(0, len(ordered), _SIGNATURE_BATCH_SIZE):
+                    batch = ordered[start:start + _SIGNATURE_BATCH_SIZE]
+                    existing.update(session.execute(
+                        select(CompletedTask.task_sig).where(CompletedTask.task_sig.in_(batch))
+                    ).scalars())
+                new_sigs = task_sigs - existing
+                if new_sigs:
+                    session.execute(insert(CompletedTask), [{"task_sig": task_sig} for task_sig in new_sigs])
+        except Exception as e:
+            raise Exception("Failed to record solved tasks: " + str(e))
+        for task_sig in task_sigs:
+            self._solved_filter.add(task_sig)
+
+    def cache_plan(self, goal, embedding, plan_json, conn=None):
+        """
+        Store a completed plan in the plan cache so similar goals can reuse it.
+
+        Args:
+            goal (str): The goal the plan was generated for.
+            embedding (numpy.ndarray): The embedding of the goal.
+            plan_json (str): The serialized plan.
+            conn (Connection, optional): An open connection whose transaction should be reused.
         """
         try:
-            session = self.Session()
-            # Retrieve all plans
-            plans = session.query(Plan).all()
-            for plan in plans:
-                # Check if all tasks for this plan are completed
-                tasks = session.query(Task).filter_by(plan_id=plan.id).all()
-                if all(task.completed for task in tasks):
-                    # If all tasks are completed, mark the plan as completed
-                    plan.completed = True
-            session.commit()
+            with self._session(conn) as session:
+                goal_hash = hashlib.sha256(goal.encode("utf-8")).hexdigest()
+                entry = session.query(PlanCache).filter_by(goal_hash=goal_hash).first()
+                if entry is None:
+                    entry = PlanCache(goal_hash=goal_hash, hits=0)
+                    session.add(entry)
+                entry.embedding = np.asarray(embedding, dtype=np.float32).tobytes()
+                entry.plan_json = plan_json
         except Exception as e:
-            raise Exception("Failed to update goals: " + str(e))
\ No newline at end of file
+            raise Exception("Failed to cache plan: " + str(e))
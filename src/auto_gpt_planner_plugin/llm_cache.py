@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class LLMCache:
+    """
+    The LLMCache class is a content-addressed cache for LLM responses. Identical requests (same model, messages,
+    temperature and token limit) map to the same key, so a repeated request can be answered without calling the API.
+
+    Entries are kept in an in-memory LRU by default. Setting PLANNER_CACHE_BACKEND to "diskcache" or "redis" stores
+    them in a diskcache directory (PLANNER_CACHE_DIR) or a Redis server (PLANNER_CACHE_REDIS_URL) instead.
+    """
+
+    def __init__(self, backend="memory", maxsize=256, **options):
+        """
+        Initialize a new LLMCache instance.
+
+        Args:
+            backend (str): The storage backend, one of "memory", "diskcache" or "redis".
+            maxsize (int): The maximum number of entries kept by the in-memory backend.
+            options: Backend specific options: "directory" for diskcache, "url" for redis.
+        """
+        self.backend = backend
+        self.maxsize = maxsize
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        if backend == "memory":
+            self._store = OrderedDict()
+        elif backend == "diskcache":
+            import diskcache
+            self._store = diskcache.Cache(options.get("directory", ".planner_cache"))
+        elif backend == "redis":
+            import redis
+            self._store = redis.Redis.from_url(options.get("url", "redis://localhost:6379/0"))
+        else:
+            raise ValueError(f"Unknown LLM cache backend: {backend}")
+
+    @classmethod
+    def from_env(cls):
+        """
+        Create an LLMCache configured from the PLANNER_CACHE_* environment variables.
+
+        Returns:
+            LLMCache: The configured cache.
+        """
+        return cls(
+            backend=os.getenv('PLANNER_CACHE_BACKEND', 'memory'),
+            maxsize=int(os.getenv('PLANNER_CACHE_SIZE', 256)),
+            directory=os.getenv('PLANNER_CACHE_DIR', '.planner_cache'),
+            url=os.getenv('PLANNER_CACHE_REDIS_URL', 'redis://localhost:6379/0'),
+        )
+
+    @staticmethod
+    def make_key(model, messages, temperature, max_tokens):
+        """
+        Build the cache key for a chat completion request.
+
+        Args:
+            model (str): The model name.
+            messages (list): The chat messages.
+            temperature (float): The sampling temperature.
+            max_tokens (int): The token limit.
+
+        Returns:
+            str: The SHA-256 hex digest of the request.
+        """
+        payload = {"model": model, "messages": messages, "temperature": float(temperature), "max_tokens": int(max_tokens)}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Retrieve a cached response.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            str: The cached response, or None on a miss.
+        """
+        with self._lock:
+            value = self._get(key)
+            self.stats["hits" if value is not None else "misses"] += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a response in the cache.
+
+        Args:
+            key (str): The cache key.
+            value (str): The response to be cached.
+            ttl (int, optional): The number of seconds after which the entry expires.
+        """
+        with self._lock:
+            if self.backend == "memory":
+                expires_at = time.monotonic() + ttl if ttl else None
+                self._store[key] = (value, expires_at)
+                self._store.move_to_end(key)
+                while len(self._store) > self.maxsize:
+                    self._store.popitem(last=False)
+            elif self.backend == "diskcache":
+                self._store.set(key, value, expire=ttl)
+            else:
+                self._store.set(key, value.encode("utf-8"), ex=ttl)
+
+    def _get(self, key):
+        """
+        Look up a key in the configured backend, dropping it if it has expired.
+        """
+        if self.backend == "memory":
+            entry = self._store.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._store[key]
+                return None
+            self._store.move_to_end(key)
+            return value
+        if self.backend == "diskcache":
+            return self._store.get(key)
+        value = self._store.get(key)
+        return value.decode("utf-8") if value is not None else None
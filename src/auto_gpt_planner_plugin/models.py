@@ -1,4 +1,5 @@
 import uuid
+from dataclasses import dataclass
 from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Enum, ForeignKey
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
@@ -7,6 +8,9 @@ from sqlalchemy.ext.declarative import declarative_base
 # The Base is the base class which maintains a catalog of classes and tables relative to that base.
 Base = declarative_base()
 
+# Keys every task dictionary of a plan must have
+REQUIRED_TASK_KEYS = frozenset(("id", "description", "priority", "completed"))
+
 class Task(Base):
     """
     This class represents a Task table in the database. 
@@ -34,6 +38,35 @@ class Plan(Base):
     completed = Column(Boolean, default=False) # Whether the plan has been completed
     tasks = relationship("Task", back_populates="plan") # Relationship to the Task table
 
+@dataclass(frozen=True)
+class TaskDTO:
+    """
+    This class is a lightweight, immutable view of a task as passed between the Planner and the TaskManager.
+    Its fields are validated once when it is constructed, so methods receiving a TaskDTO don't need to re-check them.
+    """
+    __slots__ = ("id", "description", "priority", "completed")
+    id: int
+    description: str
+    priority: int
+    completed: bool
+
+    @classmethod
+    def from_dict(cls, task):
+        """
+        Build a TaskDTO from a task dictionary, ignoring any extra keys.
+
+        Args:
+            task (dict): The task dictionary.
+
+        Returns:
+            TaskDTO: The validated task.
+        """
+        if not isinstance(task, dict):
+            raise ValueError("Each task in the plan must be a dictionary")
+        if not REQUIRED_TASK_KEYS.issubset(task):
+            raise ValueError(f"A task in the plan is missing one or more required keys: {list(cls.__slots__)}")
+        return cls(task["id"], task["description"], task["priority"], task["completed"])
+
 # Generate a unique identifier
 uuid_str = str(uuid.uuid4())
 # Use the UUID to create a unique database name
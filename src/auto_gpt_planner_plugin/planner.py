@@ -1,13 +1,135 @@
+import asyncio
+import hashlib
+import io
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from functools import cached_property
 import os
+import numpy as np
 import openai
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, scoped_session
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, Boolean
 from .tasks import TaskManager
-from .database import DatabaseManager
+from .database import DatabaseManager, task_signature
+from .models import REQUIRED_TASK_KEYS, TaskDTO
+from .llm_cache import LLMCache
+from .rate_limiter import RateLimiter
+
+# Fixed sections of the plan prompt
+HEADER = "# Project Plan\n\n"
+GOALS_HDR = "## Goals:\n"
+TASKS_HDR = "## Tasks:\n"
+REVISED_HDR = "## Revised Plan:\n\n"
+_CHECKED = "- [x] "
+_UNCHECKED = "- [ ] "
+
+# Goal and task lines of a plan prompt; everything else is the prompt's structural template
+_GOAL_LINE = re.compile(r'^\d+\. .*$', re.MULTILINE)
+_TASK_LINE = re.compile(r'^- \[[x ]\] .*$', re.MULTILINE)
+# Words compared when deciding whether two goal lists are similar enough to share a plan template
+_WORD = re.compile(r'\w+')
+# Checklist items of a generated plan, as the model may format them
+_CHECKLIST_ITEM = re.compile(r'^\s*[-*] \[([ xX])\] (.+?)\s*$', re.MULTILINE)
+
+# Static instructions sent ahead of the dynamic plan, kept byte-identical across calls so the provider's
+# prompt cache can match the message prefix
+_SYSTEM_PROMPT = "You are an assistant that improves and adds crucial points to plans in .md format."
+_UPDATE_INSTRUCTIONS = ("Update the plan given by the user according to the status of its tasks, keep the .md "
+                        "format. Include the current tasks in the improved plan, keep mind of their status and track "
+                        "them with a checklist. Revised version should comply with the contents of the tasks at hand.")
+_SOLVE_PROMPT = "You are an assistant that solves the tasks of a plan. Reply with the solution to the task given by the user."
+_SOLVE_BATCH_PROMPT = ("You are an assistant that solves the tasks of a plan. The user gives a numbered checklist of "
+                       "tasks, each prefixed with its id. Reply with only a JSON array of objects with the keys \"id\" "
+                       "and \"solution\", one for every task.")
+_ADAPT_INSTRUCTIONS = ("Adapt the cached plan given by the user, written for a similar goal, to the plan below it, keep "
+                       "the .md format. Include the current tasks in the adapted plan, keep mind of their status and "
+                       "track them with a checklist.")
+
+# Attempts made for a solve request that keeps hitting the rate limit, backing off exponentially in between
+_SOLVE_RETRIES = 5
+# Completion tokens set aside for each task of a batched solve request; the tasks are split into requests that
+# each fit in the token limit at this rate
+_SOLVE_TOKENS_PER_TASK = 250
+# A reply wrapped in a Markdown code fence, as models often format JSON
+_CODE_FENCE = re.compile(r'^```[\w-]*\s*(.*?)\s*```$', re.DOTALL)
+
+def _run_sync(coro):
+    """
+    Run a coroutine to completion from synchronous code. asyncio.run can't be called while an event loop is running
+    in the current thread, so in that case the coroutine runs on its own loop in a worker thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+def _estimate_tokens(messages, max_tokens):
+    """
+    Estimate the tokens a chat completion request counts against the rate limit: its prompt, at roughly four
+    characters per token plus a few per message, and the full completion budget.
+    """
+    return sum(len(message["content"]) // 4 + 4 for message in messages) + max_tokens
 
-Base = declarative_base()
+
+def _template_key(prompt):
+    """
+    Hash the structure of a plan prompt, with the goal and task lines replaced by placeholders.
+    """
+    template = _TASK_LINE.sub('- {TASK}', _GOAL_LINE.sub('{GOAL}', prompt))
+    return hashlib.sha256(template.encode("utf-8")).hexdigest()
+
+
+def _goal_overlap(goals, other_goals):
+    """
+    Measure how alike two goal lists are, as the Jaccard similarity of their lowercased words.
+    """
+    words = set(_WORD.findall(" ".join(goals).lower()))
+    other_words = set(_WORD.findall(" ".join(other_goals).lower()))
+    if not words and not other_words:
+        return 1.0
+    return len(words & other_words) / len(words | other_words)
+
+
+def _checklist_tasks(plan):
+    """
+    Turn the checklist of a generated plan into task dictionaries, the first item getting the highest priority.
+    Their ids are left to the database.
+    """
+    items = _CHECKLIST_ITEM.findall(plan)
+    return [
+        {"id": None, "description": description, "priority": len(items) - index, "completed": mark != " "}
+        for index, (mark, description) in enumerate(items)
+    ]
+
+
+def _rewrite_plan(plan, old_goals, new_goals, old_tasks, new_tasks):
+    """
+    Rewrite a plan generated for one set of goals and tasks so it refers to another set with the same structure.
+
+    Args:
+        plan (str): The cached plan.
+        old_goals (list): The goals the plan was generated for.
+        new_goals (list): The goals to substitute.
+        old_tasks (list): The (description, completed) pairs the plan was generated for.
+        new_tasks (list): The (description, completed) pairs to substitute.
+
+    Returns:
+        str: The rewritten plan.
+    """
+    replacements = {old: new for old, new in zip(old_goals, new_goals) if old}
+    replacements.update((old[0], new[0]) for old, new in zip(old_tasks, new_tasks) if old[0])
+    if replacements:
+        # Substitute in a single pass so a new value is never rewritten again by a later replacement
+        pattern = re.compile("|".join(re.escape(old) for old in sorted(replacements, key=len, reverse=True)))
+        plan = pattern.sub(lambda match: replacements[match.group(0)], plan)
+    # Bring the checklist in line with the current task status
+    for description, completed in new_tasks:
+        checkbox = f"- [{'x' if completed else ' '}] {description}"
+        plan = re.sub(r'- \[[x ]\] ' + re.escape(description) + '$', lambda _: checkbox, plan, flags=re.MULTILINE)
+    return plan
 
 class Planner:
     """
@@ -15,46 +137,193 @@ class Planner:
     allowing for tasks and plans to be created, updated, and retrieved.
     """
 
-    def __init__(self, engine, task_manager=None):
+    def __init__(self, engine, task_manager=None, database_manager=None):
         """
         Initialize a new Planner instance.
 
         Args:
             engine: The SQLAlchemy engine object.
-            task_manager: An optional TaskManager instance. If not provided, a new one will be created.
+            task_manager: An optional TaskManager instance. If not provided, one will be created on first use.
+            database_manager: An optional DatabaseManager instance. If not provided, one will be created on first use.
         """
         self.engine = engine
-        Base.metadata.create_all(self.engine)
-        self.Session = scoped_session(sessionmaker(bind=self.engine))
-        self.task_manager = task_manager or TaskManager(engine)
-        self.database_manager = DatabaseManager(engine)
+        if task_manager is not None:
+            self.task_manager = task_manager
+        if database_manager is not None:
+            self.database_manager = database_manager
+        # Model settings don't change at runtime, so resolve them once
+        self._model = os.getenv('PLANNER_MODEL', os.getenv('FAST_LLM_MODEL', 'gpt-3.5-turbo'))
+        self._max_tokens = int(os.getenv('PLANNER_TOKEN_LIMIT', os.getenv('FAST_TOKEN_LIMIT', 1500)))
+        self._temperature = float(os.getenv('PLANNER_TEMPERATURE', os.getenv('TEMPERATURE', 0.5)))
+        self._embedding_model = os.getenv('PLANNER_EMBEDDING_MODEL', 'text-embedding-ada-002')
+        # Prompts of the same shape only share a plan template if their goals overlap at least this much
+        self._template_similarity = float(os.getenv('PLANNER_TEMPLATE_SIMILARITY', 0.8))
+        self.llm_cache = LLMCache.from_env()
+        # Shared by every solve request, so the per-minute limits hold across planning cycles
+        self.rate_limiter = RateLimiter.from_env()
+        self._template_cache = LLMCache(maxsize=256)
+        self._plan_cache = LLMCache(maxsize=256)
+        # The id of the Batch API batch submitted by run_initial_planning_cycle_batch and not yet collected
+        self.pending_batch_id = None
+        # All tasks as of the current planning cycle. It is re-read at the start of every cycle, since other
+        # components complete tasks in between, and cleared whenever the planner changes them
+        self._tasks_cache = None
 
+    def _tasks(self):
+        """
+        Return all tasks, querying the database only once per planning cycle. The cycle clears the memo when it starts.
+        """
+        if self._tasks_cache is None:
+            self._tasks_cache = self.task_manager.get_all_tasks()
+        return self._tasks_cache
 
-    def run_initial_planning_cycle(self):
+    @cached_property
+    def task_manager(self):
         """
-        Run the initial planning cycle. This involves generating a new plan and task database, creating tasks based on the plan,
-        and starting the execution of tasks.
+        The TaskManager for the planner's engine, created on first use unless one was given.
         """
-        # Generate plan and task databases
-        if not self.generate_plan_database():
-            raise Exception("Failed to generate plan database")
-        if not self.generate_task_database():
-            raise Exception("Failed to generate task database")
+        return TaskManager(self.engine)
+
+    @cached_property
+    def database_manager(self):
+        """
+        The DatabaseManager for the planner's engine, created on first use unless one was given.
+        """
+        return DatabaseManager(self.engine)
+
+    def run_initial_planning_cycle(self, goals):
+        """
+        Run the initial planning cycle. This involves generating a new plan, creating tasks for the checklist items
+        the plan adds, and solving and completing every incomplete task.
+
+        If PLANNER_USE_BATCH_API is set to 1, the plan and the incomplete tasks go through the OpenAI Batch API instead.
+
+        Args:
+            goals (list): The goals to generate a plan for.
 
-        # Generate plan and tasks
-        plan = self.generate_plan()
+        Returns:
+            str: The generated plan.
+        """
+        self._tasks_cache = None
+        if os.getenv('PLANNER_USE_BATCH_API') == '1':
+            return self.run_initial_planning_cycle_batch(goals)
+
+        plan = self.generate_plan(goals)
         if not plan:
             raise Exception("Failed to generate plan")
-        tasks = self.generate_tasks(plan)
-        if not tasks:
-            raise Exception("Failed to generate tasks")
 
-        # Start execution of tasks
-        for task in tasks:
-            if not self.solve_task(task):
-                raise Exception(f"Failed to solve task {task.id}")
-            if not self.mark_task_complete(task):
-                raise Exception(f"Failed to mark task {task.id} as complete")
+        # The plan lists the existing tasks too, so only its other checklist items become new tasks
+        known = {task.description for task in self._tasks()}
+        self.generate_tasks([task for task in _checklist_tasks(plan) if task["description"] not in known])
+
+        self.complete_tasks(self.task_manager.get_incomplete_tasks())
+        return plan
+
+    def run_initial_planning_cycle_batch(self, goals=None):
+        """
+        Run a planning cycle through the OpenAI Batch API, which costs half as much and has its own rate limits but
+        completes within 24 hours. The plan request for the given goals and a solve request for every incomplete task
+        are submitted as one batch, whose id is kept in pending_batch_id. The cycle doesn't wait for it: every later
+        cycle checks the batch once, and the one that finds it finished marks the solved tasks complete and returns
+        the plan. A new batch is only submitted once the pending one has been collected.
+
+        Args:
+            goals (list, optional): The goals to generate a plan for. If not given, only the tasks are solved.
+
+        Returns:
+            str: The improved plan once a batch with a plan request has been collected, otherwise None.
+
+        Raises:
+            Exception: If the pending batch failed, expired or was cancelled.
+        """
+        self._tasks_cache = None
+        if self.pending_batch_id is not None:
+            return self.collect_batch(self.pending_batch_id)
+        self.pending_batch_id = self.submit_batch(goals)
+        return None
+
+    def submit_batch(self, goals=None):
+        """
+        Submit the plan request for the given goals and a solve request for every incomplete task as one batch.
+
+        Args:
+            goals (list, optional): The goals to generate a plan for. If not given, only the tasks are solved.
+
+        Returns:
+            str: The id of the batch, or None if there was nothing to submit.
+        """
+        tasks = self.task_manager.get_incomplete_tasks()
+
+        # One chat completion request per line, routed back to its task by custom_id
+        requests = [(f"task-{task.id}", self._solve_messages(task)) for task in tasks]
+        if goals:
+            prompt = self.construct_plan_prompt(goals)
+            requests.append(("plan", self._plan_messages(prompt)))
+        if not requests:
+            return None
+        batch_input = "\n".join(
+            json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": self._model,
+                    "messages": messages,
+                    "max_tokens": self._max_tokens,
+                    "temperature": self._temperature,
+                },
+            })
+            for custom_id, messages in requests
+        )
+
+        # The 0.x openai package has no Batch resource, so the batch endpoints are called through its requestor
+        input_file = openai.File.create(file=("batch.jsonl", batch_input.encode("utf-8")), purpose="batch")
+        batch, _, _ = openai.api_requestor.APIRequestor().request("post", "/batches", {
+            "input_file_id": input_file["id"],
+            "endpoint": "/v1/chat/completions",
+            "completion_window": "24h",
+        })
+        return batch.data["id"]
+
+    def collect_batch(self, batch_id):
+        """
+        Check a submitted batch once and, if it has finished, mark its solved tasks complete. A batch submitted by an
+        earlier process can be collected by passing its id.
+
+        Args:
+            batch_id (str): The id of the batch.
+
+        Returns:
+            str: The improved plan if the batch has finished and included a plan request, otherwise None.
+
+        Raises:
+            Exception: If the batch failed, expired or was cancelled.
+        """
+        batch, _, _ = openai.api_requestor.APIRequestor().request("get", f"/batches/{batch_id}")
+        batch = batch.data
+        if batch["status"] not in ("completed", "failed", "expired", "cancelled"):
+            return None
+        if self.pending_batch_id == batch_id:
+            self.pending_batch_id = None
+        if batch["status"] != "completed":
+            raise Exception(f"Batch {batch_id} did not complete: {batch['status']}")
+
+        plan = None
+        solutions = {}
+        for line in openai.File.download(batch["output_file_id"]).decode("utf-8").splitlines():
+            result = json.loads(line)
+            response = result.get("response")
+            if not response or response["status_code"] != 200:
+                continue
+            content = response["body"]["choices"][0]["message"]["content"].strip()
+            if result["custom_id"] == "plan":
+                plan = content
+            elif content:
+                solutions[int(result["custom_id"][len("task-"):])] = content
+
+        # Tasks whose request failed stay incomplete and are submitted again with the next batch
+        self.complete_tasks([task for task in self.task_manager.get_incomplete_tasks() if task.id in solutions], solutions)
+        return plan
 
     def generate_plan_database(self):
         """
@@ -87,33 +356,81 @@ class Planner:
         if not isinstance(goals, list):
             raise TypeError("Goals must be a list")
 
-        plan_prompt = "# Project Plan\n\n"
-
-        # Append goals section
-        plan_prompt += "## Goals:\n"
+        # Write the sections straight into one buffer rather than collecting every fragment first
+        buf = io.StringIO()
+        buf.write(HEADER)
+        buf.write(GOALS_HDR)
         for index, goal in enumerate(goals, start=1):
-            plan_prompt += f"{index}. {goal}\n"
-        plan_prompt += "\n"
+            buf.write(f"{index}. {goal}\n")
+        buf.write("\n")
+        buf.write(TASKS_HDR)
+        for _, description, completed, _ in self._tasks():
+            buf.write(_CHECKED if completed else _UNCHECKED)
+            buf.write(f"{description}\n")
+        buf.write("\n")
+        buf.write(REVISED_HDR)
+        return buf.getvalue()
 
-        # Append tasks section
-        plan_prompt += "## Tasks:\n"
-        tasks = self.task_manager.get_all_tasks()  # Assuming you have a method to get all tasks
-        for task in tasks:
-            completed_status = "[x]" if task.completed else "[ ]"
-            plan_prompt += f"- {completed_status} {task.description}\n"
-        plan_prompt += "\n"
+    def embed_goals(self, goals):
+        """
+        Embed the given goals so they can be compared against cached plans.
 
-        # Append revised plan section
-        plan_prompt += "## Revised Plan:\n\n"
+        Args:
+            goals: The goals to be embedded.
 
-        return plan_prompt
+        Returns:
+            numpy.ndarray: The float32 embedding of the goals.
+        """
+        if not isinstance(goals, list):
+            raise TypeError("Goals must be a list")
+
+        response = openai.Embedding.create(model=self._embedding_model, input="\n".join(goals))
+        return np.asarray(response["data"][0]["embedding"], dtype=np.float32)
+
+    def _plan_messages(self, prompt, cached_plan=None):
+        """
+        Build the chat messages asking for the given plan prompt to be improved, or a cached plan adapted to it.
+        The prompt already lists the tasks with their status.
+        """
+        if cached_plan is not None:
+            # Adapt the plan of a similar goal instead of decomposing the goals again
+            cached_plan = json.loads(cached_plan)["plan"]
+            instructions = _ADAPT_INSTRUCTIONS
+            content = f"## Cached Plan:\n{cached_plan}\n\n{prompt}"
+        else:
+            instructions = _UPDATE_INSTRUCTIONS
+            content = prompt
+
+        # Only the trailing user message changes between calls
+        return [
+            {"role": "system", "content": _SYSTEM_PROMPT},
+            {"role": "system", "content": instructions},
+            {"role": "user", "content": content},
+        ]
+
+    def _cached_completion(self, messages):
+        """
+        Look up the completion of the given plan messages in the LLM cache. Only deterministic (temperature 0)
+        completions are reused from the cache.
+
+        Returns:
+            tuple: The cache key, or None if completions aren't cached, and the cached completion, or None on a miss.
+        """
+        if self._temperature != 0.0:
+            return None, None
+        cache_key = self.llm_cache.make_key(self._model, messages, self._temperature, self._max_tokens)
+        return cache_key, self.llm_cache.get(cache_key)
 
-    def generate_plan(self, goals):
+    def generate_plan(self, goals, cached_plan=None):
         """
         Generate a new plan based on the given goals. Includes generating an improved plan using ChatCompletion.
+        If a cached plan for a similar goal is given, it is adapted instead of decomposing the goals from scratch.
 
         Args:
             goals: The goals to be achieved.
+            cached_plan (str | Callable[[], str], optional): The JSON of a cached plan for a similar goal, or a
+                function looking it up. The function is only called if the in-memory plan and response caches miss,
+                so a lookup that calls the embeddings API is skipped whenever they can answer.
 
         Returns:
             Plan: The generated plan.
@@ -121,108 +438,264 @@ class Planner:
         if not isinstance(goals, list):
             raise TypeError("Goals must be a list")
 
-        tasks = self.task_manager.get_all_tasks()  # Get all tasks
-
-        prompt = self.construct_plan_prompt(goals, tasks)  # Pass the tasks to construct_plan_prompt
-
-        model = os.getenv('PLANNER_MODEL', os.getenv('FAST_LLM_MODEL', 'gpt-3.5-turbo'))
-        max_tokens = os.getenv('PLANNER_TOKEN_LIMIT', os.getenv('FAST_TOKEN_LIMIT', 1500))
-        temperature = os.getenv('PLANNER_TEMPERATURE', os.getenv('TEMPERATURE', 0.5))
+        # Start from the current task states, which may have changed since the last plan was generated
+        self._tasks_cache = None
+        tasks = self._tasks()
+
+        # Successive cycles mostly repeat a known (goals, task state) pair, so reuse the plan generated for it
+        state_key = (tuple(sorted(goals)), tuple((task.id, bool(task.completed)) for task in tasks))
+        state_plan = self._plan_cache.get(state_key)
+        if state_plan is not None:
+            return state_plan
+
+        prompt = self.construct_plan_prompt(goals)
+
+        # Reuse the plan of a structurally identical prompt for closely matching goals, substituting the new goals
+        # and tasks locally. The template key only captures the number of goals and tasks, so unrelated goals of
+        # the same count are sent to the model instead.
+        task_states = [(task.description, bool(task.completed)) for task in tasks]
+        template_key = _template_key(prompt)
+        template_entry = self._template_cache.get(template_key)
+        if template_entry is not None and _goal_overlap(goals, template_entry[0]) >= self._template_similarity:
+            cached_goals, cached_tasks, cached_improved_plan = template_entry
+            improved_plan = _rewrite_plan(cached_improved_plan, cached_goals, goals, cached_tasks, task_states)
+            self._plan_cache.set(state_key, improved_plan)
+            return improved_plan
+
+        find_cached_plan = cached_plan if callable(cached_plan) else None
+        messages = self._plan_messages(prompt, None if find_cached_plan else cached_plan)
+        cache_key, cached_response = self._cached_completion(messages)
+        if cached_response is None and find_cached_plan is not None:
+            cached_plan = find_cached_plan()
+            if cached_plan is not None:
+                messages = self._plan_messages(prompt, cached_plan)
+                cache_key, cached_response = self._cached_completion(messages)
+        if cached_response is not None:
+            return cached_response
 
         # Call the OpenAI API for chat completion
         response = openai.ChatCompletion.create(
-            model=model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an assistant that improves and adds crucial points to plans in .md format.",
-                },
-                {
-                    "role": "user",
-                    "content": f"Update the following plan given the task status below, keep the .md format:\n{prompt}\n"
-                               f"Include the current tasks in the improved plan, keep mind of their status and track them "
-                               f"with a checklist:\n{tasks}\n Revised version should comply with the contents of the "
-                               f"tasks at hand:",
-                },
-            ],
-            max_tokens=int(max_tokens),
+            model=self._model,
+            messages=messages,
+            max_tokens=self._max_tokens,
             n=1,
-            temperature=float(temperature),
+            temperature=self._temperature,
         )
-
-        # Extract the improved plan from the response
         improved_plan = response.choices[0].message.content.strip()
+        if cache_key is not None:
+            self.llm_cache.set(cache_key, improved_plan, ttl=3600)
+        self._template_cache.set(template_key, (list(goals), task_states, improved_plan))
+        self._plan_cache.set(state_key, improved_plan)
         return improved_plan
 
-    def generate_tasks(self, plan):
+    def generate_tasks(self, plan, conn=None):
         """
-        Generates unique tasks based on the new plan.
+        Generates unique tasks based on the new plan and inserts them into the database in a single batch.
+
+        Args:
+            plan: The list of task dictionaries making up the plan.
+            conn (Connection, optional): An open connection whose transaction should be reused.
+
+        Returns:
+            List[TaskDTO]: The tasks that were created.
         """
         if not isinstance(plan, list):
             raise TypeError("Plan must be a list of tasks")
         if not plan:
             return []
-        for task in plan:
-            if not isinstance(task, dict):
-                raise ValueError("Each task in the plan must be a dictionary")
-            required_keys = ["id", "description", "priority", "completed"]
-            if not all(key in task for key in required_keys):
-                raise ValueError(f"A task in the plan is missing one or more required keys: {required_keys}")
-        return self.task_manager.generate_tasks(plan)
+        # Report every incomplete task of the plan at once, then convert each task to a TaskDTO
+        missing = [index for index, task in enumerate(plan) if isinstance(task, dict) and not REQUIRED_TASK_KEYS.issubset(task)]
+        if missing:
+            raise ValueError(f"Tasks {missing} of the plan are missing one or more required keys: {sorted(REQUIRED_TASK_KEYS)}")
+        tasks = [TaskDTO.from_dict(task) for task in plan]
+        # Tasks without an id are given one by the database
+        rows = [{key: value for key, value in asdict(task).items() if key != "id" or value is not None} for task in tasks]
+        self.task_manager.create_tasks(rows, conn=conn)
+        self._tasks_cache = None
+        return tasks
 
 
     def solve_task(self, task):
         """
-        Solve the task with the highest priority using the solve method.
+        Solve the given task using ChatCompletion.
 
         Args:
-            task (Task): The task to be solved.
+            task (TaskDTO): The task to be solved.
+
+        Returns:
+            str: The solution to the task.
         """
-        if not isinstance(task, dict):
-            raise TypeError("Task must be a dictionary")
-        required_keys = ["id", "description", "priority", "completed"]
-        if not all(key in task for key in required_keys):
-            raise ValueError(f"Task is missing one or more required keys: {required_keys}")
-        return self.task_manager.solve_task(task)
+        if not isinstance(task, TaskDTO):
+            raise TypeError("Task must be a TaskDTO")
+        return _run_sync(self._solve_one(task, asyncio.Semaphore(1)))
+
+    def solve_tasks_batch(self, tasks):
+        """
+        Solve the given tasks with as few ChatCompletion requests as possible. Each request carries as many tasks as
+        fit in the token limit at _SOLVE_TOKENS_PER_TASK tokens per task, so long checklists aren't cut off mid-reply.
+        The requests are sent concurrently, at most PLANNER_MAX_CONCURRENCY at a time, under the rate limiter's
+        per-minute limits.
+
+        Args:
+            tasks (List[TaskDTO]): The tasks to be solved.
+
+        Returns:
+            dict: The solutions, keyed by task ID.
+
+        Raises:
+            Exception: If a response is cut off or isn't a valid JSON array of solutions.
+        """
+        chunk_size = max(1, self._max_tokens // _SOLVE_TOKENS_PER_TASK)
+        chunks = [tasks[start:start + chunk_size] for start in range(0, len(tasks), chunk_size)]
+        solutions = {}
+        if chunks:
+            for chunk_solutions in _run_sync(self._solve_chunks(chunks)):
+                solutions.update(chunk_solutions)
+        return solutions
+
+    async def _solve_chunks(self, chunks):
+        """
+        Solve the given lists of tasks concurrently, one request per list.
+        """
+        semaphore = asyncio.Semaphore(int(os.getenv('PLANNER_MAX_CONCURRENCY', 5)))
+        return await asyncio.gather(*[self._solve_chunk(chunk, semaphore) for chunk in chunks])
+
+    async def _solve_chunk(self, tasks, semaphore):
+        """
+        Solve the given tasks with a single ChatCompletion request.
+        """
+        checklist = "\n".join(f"{index}. [id {task.id}] {task.description}" for index, task in enumerate(tasks, start=1))
+        messages = [
+            {"role": "system", "content": _SOLVE_BATCH_PROMPT},
+            {"role": "user", "content": checklist},
+        ]
+        response = await self._request(messages, semaphore, f"Failed to solve tasks {[task.id for task in tasks]}")
+        choice = response.choices[0]
+        if choice.get("finish_reason") == "length":
+            raise Exception(f"Failed to parse task solutions: the reply for {len(tasks)} tasks exceeded the token limit")
+        content = choice.message.content.strip()
+        fenced = _CODE_FENCE.match(content)
+        if fenced:
+            content = fenced.group(1)
+        try:
+            return {int(solution["id"]): solution["solution"] for solution in json.loads(content)}
+        except Exception as e:
+            raise Exception("Failed to parse task solutions: " + str(e))
+
+    def _solve_messages(self, task):
+        """
+        Build the chat messages asking for the given task to be solved.
+        """
+        return [
+            {"role": "system", "content": _SOLVE_PROMPT},
+            {"role": "user", "content": task.description},
+        ]
+
+    async def _request(self, messages, semaphore, failure):
+        """
+        Send a ChatCompletion request, waiting for a free slot in the semaphore and for room under the per-minute
+        request and token limits, and backing off if the API still reports a rate limit. failure prefixes the error
+        raised once every attempt was rate limited.
+        """
+        tokens = _estimate_tokens(messages, self._max_tokens)
+        async with semaphore:
+            for attempt in range(_SOLVE_RETRIES):
+                await self.rate_limiter.acquire(tokens)
+                try:
+                    return await openai.ChatCompletion.acreate(
+                        model=self._model,
+                        messages=messages,
+                        max_tokens=self._max_tokens,
+                        n=1,
+                        temperature=self._temperature,
+                    )
+                except openai.error.RateLimitError:
+                    await asyncio.sleep(2 ** attempt)
+        raise Exception(failure + ": rate limit exceeded")
+
+    async def _solve_one(self, task, semaphore):
+        """
+        Solve a single task with its own ChatCompletion request.
+        """
+        response = await self._request(self._solve_messages(task), semaphore, f"Failed to solve task {task.id}")
+        return response.choices[0].message.content.strip()
+
+    def complete_tasks(self, tasks, solutions=None):
+        """
+        Solve the given tasks and mark them complete. Tasks solved by an earlier cycle are marked complete without
+        being sent again, and the rest are solved with solve_tasks_batch. The tasks are marked complete and their
+        signatures recorded in one transaction, once all of them are solved.
+
+        Args:
+            tasks (List[Task | TaskDTO]): The tasks to be completed.
+            solutions (dict, optional): Solutions already obtained for some of the tasks, keyed by task ID, such as
+                those of a collected batch. These tasks aren't solved again.
+
+        Returns:
+            dict: The solutions of the tasks solved by this call or given in solutions, keyed by task ID.
+
+        Raises:
+            Exception: If any of the tasks could not be solved or marked complete.
+        """
+        tasks = list(tasks)
+        solutions = dict(solutions or {})
+        if not tasks:
+            return solutions
+        signatures = {task.id: task_signature(task.description, task.priority) for task in tasks}
+        solved = self.database_manager.solved_signatures(signatures.values())
+        unsolved = [task for task in tasks if task.id not in solutions and signatures[task.id] not in solved]
+        if unsolved:
+            solutions.update(self.solve_tasks_batch(unsolved))
+            failed = [task.id for task in unsolved if not solutions.get(task.id)]
+            if failed:
+                raise Exception(f"Failed to solve tasks {failed}")
+        with self.task_manager.transaction() as conn:
+            if self.task_manager.mark_tasks_complete(list(signatures), conn=conn) != len(signatures):
+                raise Exception("Failed to mark tasks as complete")
+            self.database_manager.record_solved_tasks(signatures.values(), conn=conn)
+        self._tasks_cache = None
+        return solutions
 
     def mark_task_complete(self, task):
         """
         Mark the given task as complete.
 
         Args:
-            task (Task): The task to be marked as complete.
+            task (TaskDTO): The task to be marked as complete.
         """
-        if not isinstance(task, dict):
-            raise TypeError("Task must be a dictionary")
-        required_keys = ["id", "description", "priority", "completed"]
-        if not all(key in task for key in required_keys):
-            raise ValueError(f"Task is missing one or more required keys: {required_keys}")
-        return self.task_manager.mark_task_complete(task)
+        if not isinstance(task, TaskDTO):
+            raise TypeError("Task must be a TaskDTO")
+        result = self.task_manager.mark_task_complete(task.id)
+        self._tasks_cache = None
+        return result
 
     def update_task_database(self):
         """
         Updates the unique task database.
         """
         result = self.database_manager.update_task_database()
+        self._tasks_cache = None
         if result is None:
             raise Exception("Failed to update task database")
         return result
 
     def complete_tasks_for_goal(self, goal):
         """
-        Complete all tasks associated with a single goal.
+        Solve and complete all incomplete tasks associated with a single goal.
 
         Args:
             goal (Goal): The goal to complete tasks for.
+
+        Returns:
+            dict: The solutions of the tasks, keyed by task ID.
         """
         if not isinstance(goal, str):
             raise TypeError("Goal must be a string")
         tasks = self.task_manager.get_tasks_for_goal(goal)
-        for task in tasks:
-            if not self.solve_task(task):
-                raise Exception(f"Failed to solve task {task['id']}")
-            if not self.mark_task_complete(task):
-                raise Exception(f"Failed to mark task {task['id']} as complete")
+        try:
+            return self.complete_tasks(task for task in tasks if not task.completed)
+        except Exception as e:
+            raise Exception(f"Failed to complete tasks for goal '{goal}': " + str(e))
 
     def mark_goal_complete(self, goal):
         """
@@ -234,115 +707,18 @@ class Planner:
         if not isinstance(goal, str):
             raise TypeError("Goal must be a string")
         result = self.database_manager.mark_goal_complete(goal)
-        if result is None:
+        if not result:
             raise Exception(f"Failed to mark goal '{goal}' as complete")
         return result
 
-    def update_goals(self):
+    def update_goals(self, conn=None):
         """
         Updates the goals to complete the overall goal.
+
+        Args:
+            conn (Connection, optional): An open connection whose transaction should be reused.
         """
-        result = self.database_manager.update_goals()
+        result = self.database_manager.update_goals(conn=conn)
         if result is None:
             raise Exception("Failed to update goals")
         return result
-    
-    def start_planning_cycle(self):
-        """
-        Starts the planning cycle. This includes generating a new plan, creating tasks based on the plan,
-        and executing tasks based on their priority.
-        """
-        try:
-            self.planner.start_planning_cycle()
-        except Exception as e:
-            raise Exception("Failed to start planning cycle: " + str(e))
-
-    def generate_plan(self):
-        """
-        Generates a new plan and saves it to the database.
-        """
-        try:
-            self.planner.generate_plan()
-        except Exception as e:
-            raise Exception("Failed to generate plan: " + str(e))
-
-    def generate_tasks(self):
-        """
-        Generate tasks based on the current plan and save them to the database.
-        """
-        try:
-            self.planner.generate_tasks()
-        except Exception as e:
-            raise Exception("Failed to generate tasks: " + str(e))
-
-    def execute_task(self, task_id):
-        """
-        Executes a task based on its ID.
-
-        Args:
-            task_id (int): The ID of the task to execute.
-        """
-        try:
-            self.task_manager.execute_task(task_id)
-        except Exception as e:
-            raise Exception("Failed to execute task: " + str(e))
-
-    def mark_task_complete(self, task_id):
-        """
-        Marks a task as complete based on its ID.
-
-        Args:
-            task_id (int): The ID of the task to mark as complete.
-        """
-        try:
-            self.task_manager.mark_task_complete(task_id)
-        except Exception as e:
-            raise Exception("Failed to mark task as complete: " + str(e))
-
-    def update_plan(self):
-        """
-        Updates the current plan based on the completed tasks.
-        """
-        try:
-            self.planner.update_plan()
-        except Exception as e:
-            raise Exception("Failed to update plan: " + str(e))
-
-    def get_plan(self):
-        """
-        Retrieves the current plan from the database.
-
-        Returns:
-            Plan: The current plan.
-        """
-        try:
-            return self.planner.get_plan()
-        except Exception as e:
-            raise Exception("Failed to get plan: " + str(e))
-
-    def get_tasks(self):
-        """
-        Retrieves all tasks from the database.
-
-        Returns:
-            List[Task]: A list of all tasks.
-        """
-        try:
-            return self.task_manager.get_tasks()
-        except Exception as e:
-            raise Exception("Failed to get tasks: " + str(e))
-
-    def get_task(self, task_id):
-        """
-        Retrieve a task based on its ID.
-
-        Args:
-            task_id (int): The ID of the task to be retrieved.
-
-        Returns:
-            Task: The retrieved task.
-        """
-        try:
-            return self.task_manager.get_task(task_id)
-        except Exception as e:
-            raise Exception("Failed to get task: " + str(e))
\ No newline at end of file
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    The RateLimiter class keeps API requests under a requests-per-minute and a tokens-per-minute limit. Both limits
+    are buckets that refill continuously, so a burst can spend the capacity saved up while idle, up to one minute's
+    worth, and then proceeds at the limited rate.
+
+    The limits default to 3500 requests and 90000 tokens per minute and can be set with the
+    PLANNER_MAX_REQUESTS_PER_MINUTE and PLANNER_MAX_TOKENS_PER_MINUTE environment variables.
+    """
+
+    def __init__(self, max_requests_per_minute=3500, max_tokens_per_minute=90000):
+        """
+        Initialize a new RateLimiter instance with full buckets.
+
+        Args:
+            max_requests_per_minute (float): The number of requests allowed per minute.
+            max_tokens_per_minute (float): The number of tokens allowed per minute.
+        """
+        self.max_requests_per_minute = max_requests_per_minute
+        self.max_tokens_per_minute = max_tokens_per_minute
+        self._available_requests = float(max_requests_per_minute)
+        self._available_tokens = float(max_tokens_per_minute)
+        self._last_update = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Create a RateLimiter configured from the PLANNER_MAX_*_PER_MINUTE environment variables.
+
+        Returns:
+            RateLimiter: The configured rate limiter.
+        """
+        return cls(
+            max_requests_per_minute=float(os.getenv('PLANNER_MAX_REQUESTS_PER_MINUTE', 3500)),
+            max_tokens_per_minute=float(os.getenv('PLANNER_MAX_TOKENS_PER_MINUTE', 90000)),
+        )
+
+    async def acquire(self, tokens):
+        """
+        Wait until one request of the given number of tokens fits within both limits, and take it from the buckets.
+
+        Args:
+            tokens (int): The number of tokens the request is expected to consume, prompt and completion together.
+        """
+        while True:
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def _reserve(self, tokens):
+        """
+        Take a request of the given size from the buckets if both have room for it.
+
+        Returns:
+            float: 0 if the request was taken, otherwise the number of seconds until both buckets have room.
+        """
+        # A request larger than a whole minute's worth of tokens waits for a full bucket rather than forever
+        tokens = min(tokens, self.max_tokens_per_minute)
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._last_update
+            self._last_update = now
+            self._available_requests = min(
+                self._available_requests + elapsed * self.max_requests_per_minute / 60, self.max_requests_per_minute
+            )
+            self._available_tokens = min(
+                self._available_tokens + elapsed * self.max_tokens_per_minute / 60, self.max_tokens_per_minute
+            )
+            if self._available_requests >= 1 and self._available_tokens >= tokens:
+                self._available_requests -= 1
+                self._available_tokens -= tokens
+                return 0
+            request_wait = (1 - self._available_requests) * 60 / self.max_requests_per_minute
+            token_wait = (tokens - self._available_tokens) * 60 / self.max_tokens_per_minute
+            return max(request_wait, token_wait)
@@ -1,114 +1,476 @@
+import threading
+from contextlib import contextmanager
+from itertools import islice
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, scoped_session
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, Boolean
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker, scoped_session
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy import bindparam, delete, event, insert, select, update
+from .database import Plan, Task, ensure_schema, watch_table_writes
+from .models import TaskDTO
 
-Base = declarative_base()
+# The predicate of the ix_tasks_incomplete partial index, so incomplete-task lookups can use it
+_INCOMPLETE = Task.completed == 0
 
-class Task(Base):
-    """Task model class."""
-    __tablename__ = 'tasks'
-    id = Column(Integer, primary_key=True)
-    description = Column(String)
-    priority = Column(Integer)
-    completed = Column(Boolean)
+# Statements built once at import and reused with bound parameters for every lookup and status update
+_GET_BY_ID = select(Task).where(Task.id == bindparam("task_id"))
+_UPDATE_COMPLETE = update(Task).where(Task.id == bindparam("task_id")).values(completed=1)
+_INSERT = insert(Task)
+
+# Number of rows sent per executemany INSERT; each batch commits separately
+_INSERT_BATCH_SIZE = 10_000
+# Columns copied from Task objects passed to create_tasks and upsert_tasks
+_TASK_FIELDS = ("description", "priority", "completed", "plan_id", "goal_id")
+
+class TaskNotFound(Exception):
+    """Raised when no task with the given ID exists."""
+    def __init__(self, task_id):
+        super().__init__(f"Task with id {task_id} does not exist")
+        self.task_id = task_id
+
+def _enable_fast_executemany(conn, cursor, statement, parameters, context, executemany):
+    """
+    Let pyodbc send an executemany as one parameter array instead of one round-trip per row.
+    """
+    if executemany:
+        cursor.fast_executemany = True
+
+def _tune_bulk_inserts(engine):
+    """
+    Opt the engine into its driver's fast executemany path where it can still be changed after creation.
+    Callers creating the engine themselves can instead pass executemany_values_page_size to create_engine for
+    psycopg2, or fast_executemany=True for pyodbc.
+    """
+    if engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg2":
+        # psycopg2 already batches executemany into multi-row VALUES; send larger pages
+        if getattr(engine.dialect, "executemany_values_page_size", _INSERT_BATCH_SIZE) < _INSERT_BATCH_SIZE:
+            engine.dialect.executemany_values_page_size = _INSERT_BATCH_SIZE
+    elif engine.dialect.name == "mssql" and engine.dialect.driver == "pyodbc":
+        if not getattr(engine.dialect, "fast_executemany", False) and \
+                not event.contains(engine, "before_cursor_execute", _enable_fast_executemany):
+            event.listen(engine, "before_cursor_execute", _enable_fast_executemany)
+
+def _batches(items):
+    """
+    Split an iterable into lists of at most _INSERT_BATCH_SIZE items.
+    """
+    items = iter(items)
+    while True:
+        batch = list(islice(items, _INSERT_BATCH_SIZE))
+        if not batch:
+            return
+        yield batch
+
+def _group_by_keys(rows):
+    """
+    Group rows by the columns they set, since every row of one executemany has to bind the same columns.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(frozenset(row), []).append(row)
+    return groups.values()
+
+def _task_row(task):
+    """
+    Convert a Task object to the column values it sets, passing dictionaries through unchanged. Unset columns are
+    left out, so an INSERT gives them their defaults and an upsert leaves their stored values alone.
+    """
+    if isinstance(task, dict):
+        return task
+    row = {field: getattr(task, field) for field in _TASK_FIELDS if getattr(task, field) is not None}
+    if task.id is not None:
+        row["id"] = task.id
+    return row
+
+def _upsert(dialect_name, columns):
+    """
+    Build an INSERT for the dialect that updates the given columns of a row whose id already exists, or leaves the
+    row alone if there are no columns to update.
+    """
+    if dialect_name in ("postgresql", "sqlite"):
+        module = postgresql if dialect_name == "postgresql" else sqlite
+        stmt = module.insert(Task)
+        if not columns:
+            return stmt.on_conflict_do_nothing(index_elements=[Task.id])
+        return stmt.on_conflict_do_update(
+            index_elements=[Task.id], set_={column: stmt.excluded[column] for column in columns}
+        )
+    if dialect_name == "mysql":
+        stmt = mysql.insert(Task)
+        if not columns:
+            return stmt.prefix_with("IGNORE")
+        return stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in columns})
+    raise Exception(f"Upserting tasks is not supported on {dialect_name}")
 
 class TaskManager:
     """TaskManager class for managing tasks."""
+
     def __init__(self, engine):
         """
         Initialize a new TaskManager instance.
+
+        Callers that create the engine themselves should size its pool for concurrent planner calls, e.g.
+        create_engine(url, pool_size=10, max_overflow=-1, pool_pre_ping=True).
         Args:
-            engine: The SQLAlchemy engine object.
+            engine: The SQLAlchemy engine object, or a database URL to create a pooled engine for.
         """
+        # An engine built from a URL belongs to this TaskManager and is disposed by close()
+        self._owns_engine = isinstance(engine, str)
+        if self._owns_engine:
+            options = {"pool_pre_ping": True}
+            # SQLite uses a single-connection or null pool, which takes no sizing options
+            if make_url(engine).get_backend_name() != "sqlite":
+                options.update(pool_size=10, max_overflow=-1)
+            engine = create_engine(engine, **options)
         self.engine = engine
-        Base.metadata.create_all(self.engine)
-        self.Session = scoped_session(sessionmaker(bind=self.engine))
+        self.ensure_schema()
+        # Objects stay readable once their session is closed, since every method closes the session it opened.
+        # Writes go through Core statements, so reads never have pending ORM changes to autoflush first
+        self.Session = scoped_session(sessionmaker(bind=self.engine, expire_on_commit=False, autoflush=False))
+        # The highest priority task memoized by the current thread's request, see request(), and the number of
+        # writes to the tasks table seen in this process, which the memo is checked against
+        self._request_memo = threading.local()
+        self._write_version = 0
+        self._write_lock = threading.Lock()
+        watch_table_writes(self.engine, self)
 
-    def create_task(self, task):
+    def _get_session(self, conn=None):
         """
-        Create a new task in the database.
+        Return a session bound to the given connection, or the scoped session if no connection is given.
         Args:
-            task (Task): The task to be added to the database.
+            conn (Connection, optional): An open connection whose transaction should be reused.
+        Returns:
+            Session: The session to run the operation with.
+        """
+        if conn is None:
+            return self.Session()
+        return Session(bind=conn, autoflush=False)
+
+    def ensure_schema(self):
+        """
+        Create the plugin's tables and the tasks indexes and tune the engine's bulk inserts, once per engine per process.
+        """
+        _tune_bulk_inserts(self.engine)
+        ensure_schema(self.engine)
+
+    def close(self):
+        """
+        Release the thread's session and, if the engine was created from a URL, dispose of its connection pool.
+        """
+        self.Session.remove()
+        if self._owns_engine:
+            self.engine.dispose()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Open a transaction that several TaskManager calls can share by passing the yielded connection as conn, so a
+        single BEGIN/COMMIT covers all of their statements. Reads don't autoflush, so sequences that read back what
+        they write should share one this way rather than rely on a session's pending state.
+        Yields:
+            Connection: The connection, committed when the block exits and rolled back if it raises.
+        """
+        with self.engine.begin() as conn:
+            yield conn
+
+    def _invalidate(self, tables):
+        """
+        Count a write to the tasks table, reported by watch_table_writes.
+        Args:
+            tables (Set[str]): The names of the written tables.
+        """
+        if Task.__tablename__ in tables:
+            with self._write_lock:
+                self._write_version += 1
+
+    @contextmanager
+    def request(self):
+        """
+        Memoize get_highest_priority_task for the duration of the block, for callers that look it up several times
+        while handling one request. The memo is dropped when the outermost block exits, and is bypassed whenever a
+        write to the tasks table was seen in this process since it was read. Writes from other processes are only
+        picked up by the next request.
+        """
+        memo = self._request_memo
+        memo.depth = getattr(memo, "depth", 0) + 1
+        try:
+            yield self
+        finally:
+            memo.depth -= 1
+            if memo.depth == 0:
+                memo.__dict__.pop("task", None)
+
+    @contextmanager
+    def _connection(self, conn=None):
+        """
+        Yield the given connection, or open a new one in its own transaction if no connection is given.
+        """
+        if conn is not None:
+            yield conn
+        else:
+            with self.engine.begin() as conn:
+                yield conn
+
+    def create_task(self, task, conn=None):
+        """
+        Create a new task in the database. A Task object is given the ID it was stored with.
+        Args:
+            task (Task | dict): The task to be added to the database, or a dictionary of its column values.
+            conn (Connection, optional): An open connection whose transaction should be reused.
+        Returns:
+            int: The ID of the new task.
         Raises:
             Exception: If the task creation fails.
         """
-        session = self.Session()
         try:
-            session.add(task)
-            session.commit()
+            with self._connection(conn) as conn:
+                task_id = conn.execute(_INSERT, _task_row(task)).inserted_primary_key[0]
         except Exception as e:
-            session.rollback()
             raise Exception("Failed to create task: " + str(e))
+        if not isinstance(task, dict):
+            task.id = task_id
+        return task_id
+
+    def create_tasks(self, tasks, conn=None):
+        """
+        Create many tasks in the database with executemany INSERTs of up to 10,000 rows each. Rows setting different
+        columns, such as tasks with and without an explicit id, are sent in separate statements.
+        Args:
+            tasks (Iterable[Task | dict]): The tasks to be added, as Task objects or dictionaries of column values.
+            conn (Connection, optional): An open connection whose transaction should be reused. If not given,
+                each batch is committed in its own transaction.
+        Raises:
+            Exception: If the task creation fails.
+        """
+        try:
+            for batch in _batches(map(_task_row, tasks)):
+                with self._connection(conn) as batch_conn:
+                    for rows in _group_by_keys(batch):
+                        batch_conn.execute(_INSERT, rows)
+        except Exception as e:
+            raise Exception("Failed to create tasks: " + str(e))
+
+    def upsert_tasks(self, tasks, conn=None):
+        """
+        Insert tasks, overwriting the stored columns of any whose id already exists, with executemany
+        INSERT ... ON CONFLICT (ON DUPLICATE KEY on MySQL) statements of up to 10,000 rows per batch. Rows setting
+        different columns are sent in separate statements, and only the columns a row sets are overwritten.
+        Args:
+            tasks (Iterable[Task | dict]): The tasks to be written, as Task objects or dictionaries of column values.
+            conn (Connection, optional): An open connection whose transaction should be reused. If not given,
+                each batch is committed in its own transaction.
+        Raises:
+            Exception: If the upsert fails or the database dialect has no upsert syntax.
+        """
+        try:
+            dialect_name = self.engine.dialect.name
+            for batch in _batches(map(_task_row, tasks)):
+                with self._connection(conn) as batch_conn:
+                    for rows in _group_by_keys(batch):
+                        columns = [column for column in rows[0] if column != "id"]
+                        batch_conn.execute(_upsert(dialect_name, columns), rows)
+        except Exception as e:
+            raise Exception("Failed to upsert tasks: " + str(e))
 
-    def get_task(self, task_id):
+    def get_task(self, task_id, conn=None, columns=None):
         """
         Retrieve a task from the database.
         Args:
             task_id (int): The ID of the task to be retrieved.
+            conn (Connection, optional): An open connection whose transaction should be reused.
+            columns (List[Column], optional): The Task columns to load. If given, only those are fetched and a Row
+                is returned instead of a Task.
         Returns:
             Task: The retrieved task.
         Raises:
-            Exception: If the task with the given ID does not exist.
+            TaskNotFound: If the task with the given ID does not exist.
         """
-        session = self.Session()
-        task = session.query(Task).filter_by(id=task_id).first()
+        with self._get_session(conn) as session:
+            if columns:
+                task = session.execute(select(*columns).where(Task.id == task_id)).one_or_none()
+            else:
+                task = session.execute(_GET_BY_ID, {"task_id": task_id}).scalar_one_or_none()
         if task is None:
-            raise Exception(f"Task with id {task_id} does not exist")
+            raise TaskNotFound(task_id)
         return task
 
-    def update_task(self, task):
+    def update_task(self, task, conn=None):
         """
         Update a task in the database.
         Args:
             task (Task): The task to be updated in the database.
+            conn (Connection, optional): An open connection whose transaction should be reused.
+        Raises:
+            TaskNotFound: If the task with the given ID does not exist.
+            ValueError: If the task has no columns set besides its ID.
+        """
+        # Only the columns that are set are written, and no SELECT is needed to load the existing row first
+        values = {
+            column.name: getattr(task, column.name)
+            for column in Task.__table__.columns
+            if column.name != "id" and getattr(task, column.name) is not None
+        }
+        if not values:
+            raise ValueError(f"Task with id {task.id} has no columns to update")
+        with self._connection(conn) as conn:
+            result = conn.execute(update(Task).where(Task.id == task.id).values(**values))
+        if result.rowcount == 0:
+            raise TaskNotFound(task.id)
+
+    def update_tasks(self, mappings, conn=None):
+        """
+        Update many tasks in the database in one transaction.
+        Args:
+            mappings (List[dict]): The column values to set, each including the "id" of the task to be updated.
+            conn (Connection, optional): An open connection whose transaction should be reused.
         Raises:
             Exception: If the task update fails.
         """
-        session = self.Session()
+        if not mappings:
+            return
         try:
-            session.merge(task)
-            session.commit()
+            with self._connection(conn) as conn, Session(bind=conn) as session:
+                session.bulk_update_mappings(Task, mappings)
         except Exception as e:
-            session.rollback()
-            raise Exception("Failed to update task: " + str(e))
+            raise Exception("Failed to update tasks: " + str(e))
 
-    def delete_task(self, task_id):
+    def delete_task(self, task_id, conn=None):
         """
         Delete a task from the database.
         Args:
             task_id (int): The ID of the task to be deleted.
+            conn (Connection, optional): An open connection whose transaction should be reused.
         Raises:
-            Exception: If the task with the given ID does not exist or the deletion fails.
+            TaskNotFound: If the task with the given ID does not exist.
         """
-        session = self.Session()
-        task = session.query(Task).filter_by(id=task_id).first()
-        if task is None:
-            raise Exception(f"Task with id {task_id} does not exist")
+        with self._connection(conn) as conn:
+            result = conn.execute(delete(Task).where(Task.id == task_id))
+        if result.rowcount == 0:
+            raise TaskNotFound(task_id)
+
+    def delete_tasks(self, task_ids, conn=None):
+        """
+        Delete many tasks with DELETE ... WHERE id IN (...) statements of up to 10,000 ids each, all in one
+        transaction.
+        Args:
+            task_ids (Iterable[int]): The IDs of the tasks to be deleted.
+            conn (Connection, optional): An open connection whose transaction should be reused.
+        Returns:
+            int: The number of tasks that were deleted.
+        Raises:
+            Exception: If the deletion fails.
+        """
+        batches = [delete(Task).where(Task.id.in_(batch)) for batch in _batches(task_ids)]
+        if not batches:
+            return 0
         try:
-            session.delete(task)
-            session.commit()
+            with self._connection(conn) as conn:
+                return sum(conn.execute(stmt).rowcount for stmt in batches)
         except Exception as e:
-            session.rollback()
-            raise Exception("Failed to delete task: " + str(e))
+            raise Exception("Failed to delete tasks: " + str(e))
 
-    def get_all_tasks(self):
+    def iter_all_tasks(self, chunk=1000, conn=None):
+        """
+        Stream all tasks from the database, fetching them in chunks so the whole table is never held in memory.
+        Args:
+            chunk (int): The number of rows fetched at a time.
+            conn (Connection, optional): An open connection whose transaction should be reused.
+        Yields:
+            Row: The id, description, completed and priority of each task.
+        Raises:
+            Exception: If the task retrieval fails.
         """
-        Retrieve all tasks from the database.
+        stmt = select(Task.id, Task.description, Task.completed, Task.priority).execution_options(yield_per=chunk)
+        try:
+            # A session of its own, since the scoped session may be closed by other calls while the caller iterates
+            with Session(bind=conn if conn is not None else self.engine, autoflush=False) as session:
+                yield from session.execute(stmt)
+        except Exception as e:
+            raise Exception("Failed to retrieve tasks: " + str(e))
+
+    def get_all_tasks(self, conn=None):
+        """
+        Retrieve all tasks from the database at once. Use iter_all_tasks to scan large task tables, or
+        list_tasks_brief when the descriptions aren't needed.
+        Args:
+            conn (Connection, optional): An open connection whose transaction should be reused.
+        Returns:
+            List[Row]: The id, description, completed and priority of every task, as lightweight rows
+                rather than mapped Task instances.
+        Raises:
+            Exception: If the task retrieval fails.
+        """
+        return list(self.iter_all_tasks(conn=conn))
+
+    def list_tasks_brief(self, conn=None):
+        """
+        Retrieve the id, priority and completed status of every task, leaving out the potentially long descriptions.
+        Fetch a task's description with get_task(task_id, columns=[Task.description]) when it is needed.
+        Args:
+            conn (Connection, optional): An open connection whose transaction should be reused.
+        Returns:
+            List[Row]: The id, priority and completed status of every task.
+        Raises:
+            Exception: If the task retrieval fails.
+        """
+        try:
+            with self._get_session(conn) as session:
+                return session.execute(select(Task.id, Task.priority, Task.completed)).all()
+        except Exception as e:
+            raise Exception("Failed to retrieve tasks: " + str(e))
+
+    def get_tasks_for_goal(self, goal, conn=None):
+        """
+        Retrieve all tasks belonging to the plan for the given goal in a single joined query.
+
+        Args:
+            goal (str): The goal of the plan.
+            conn (Connection, optional): An open connection whose transaction should be reused.
+
         Returns:
-            List[Task]: The list of all tasks.
+            List[TaskDTO]: The tasks of the plan.
+
+        Raises:
+            Exception: If the task retrieval fails.
+        """
+        try:
+            stmt = (
+                select(Task.id, Task.description, Task.priority, Task.completed)
+                .join(Plan, Task.plan_id == Plan.id)
+                .where(Plan.goal == goal)
+            )
+            with self._get_session(conn) as session:
+                return [TaskDTO(**row) for row in session.execute(stmt).mappings()]
+        except Exception as e:
+            raise Exception("Failed to retrieve tasks for goal: " + str(e))
+
+    def iter_incomplete_tasks(self, chunk=1000, conn=None):
+        """
+        Stream all incomplete tasks from the database, fetching them in chunks.
+
+        Args:
+            chunk (int): The number of rows fetched at a time.
+            conn (Connection, optional): An open connection whose transaction should be reused.
+
+        Yields:
+            Task: Each incomplete task.
+
         Raises:
             Exception: If the task retrieval fails.
         """
-        session = self.Session()
-        tasks = session.query(Task).all()
-        if tasks is None:
-            raise Exception("Failed to retrieve tasks")
-        return tasks
+        stmt = select(Task).where(_INCOMPLETE).execution_options(yield_per=chunk)
+        try:
+            with Session(bind=conn if conn is not None else self.engine, autoflush=False) as session:
+                yield from session.execute(stmt).scalars()
+        except Exception as e:
+            raise Exception("Failed to retrieve incomplete tasks: " + str(e))
 
-    def get_incomplete_tasks(self):
+    def get_incomplete_tasks(self, conn=None):
         """
-        Retrieve all incomplete tasks from the database.
+        Retrieve all incomplete tasks from the database at once. Use iter_incomplete_tasks to scan large task tables.
+
+        Args:
+            conn (Connection, optional): An open connection whose transaction should be reused.
 
         Returns:
             List[Task]: The list of all incomplete tasks.
@@ -116,36 +478,57 @@ class TaskManager:
         Raises:
             Exception: If the task retrieval fails.
         """
-        session = self.Session()
-        tasks = session.query(Task).filter_by(completed=False).all()
-        if tasks is None:
-            raise Exception("Failed to retrieve incomplete tasks")
-        return tasks
+        return list(self.iter_incomplete_tasks(conn=conn))
 
-    def mark_task_complete(self, task_id):
+    def mark_task_complete(self, task_id, conn=None):
         """
         Mark a task as complete in the database.
 
         Args:
             task_id (int): The ID of the task to be marked as complete.
+            conn (Connection, optional): An open connection whose transaction should be reused.
 
         Raises:
-            Exception: If the task with the given ID does not exist or the update fails.
+            TaskNotFound: If the task with the given ID does not exist.
         """
-        session = self.Session()
-        task = session.query(Task).filter_by(id=task_id).first()
-        if task is None:
-            raise Exception(f"Task with id {task_id} does not exist")
+        with self._connection(conn) as conn:
+            result = conn.execute(_UPDATE_COMPLETE, {"task_id": task_id})
+        if result.rowcount == 0:
+            raise TaskNotFound(task_id)
+
+    def mark_tasks_complete(self, task_ids, conn=None):
+        """
+        Mark a batch of tasks as complete with UPDATE ... WHERE id IN (...) statements of up to 10,000 ids each,
+        so the parameter limit of the database is never exceeded. All of them run in one transaction.
+
+        Args:
+            task_ids (Iterable[int]): The IDs of the tasks to be marked as complete.
+            conn (Connection, optional): An open connection whose transaction should be reused.
+                If not given, the update runs in its own transaction.
+
+        Returns:
+            int: The number of tasks that were updated.
+
+        Raises:
+            Exception: If the update fails.
+        """
+        batches = [update(Task).where(Task.id.in_(batch)).values(completed=1) for batch in _batches(task_ids)]
+        if not batches:
+            return 0
         try:
-            task.completed = True
-            session.commit()
+            with self._connection(conn) as conn:
+                return sum(conn.execute(stmt).rowcount for stmt in batches)
         except Exception as e:
-            session.rollback()
-            raise Exception("Failed to mark task as complete: " + str(e))
+            raise Exception("Failed to mark tasks as complete: " + str(e))
 
-    def get_highest_priority_task(self):
+    def get_highest_priority_task(self, conn=None):
         """
-        Retrieve the highest priority task from the database.
+        Retrieve the highest priority task from the database. Within a request() block the result is memoized until
+        the tasks table is next written to, unless a connection is given, since its transaction may see uncommitted
+        changes.
+
+        Args:
+            conn (Connection, optional): An open connection whose transaction should be reused.
 
         Returns:
             Task: The highest priority task.
@@ -153,33 +536,65 @@ class TaskManager:
         Raises:
             Exception: If no incomplete tasks are found.
         """
-        session = self.Session()
-        task = session.query(Task).filter_by(completed=False).order_by(Task.priority.desc()).first()
+        memo = self._request_memo
+        memoize = conn is None and getattr(memo, "depth", 0) > 0
+        version, task = getattr(memo, "task", (None, None)) if memoize else (None, None)
+        if task is None or version != self._write_version:
+            # Read the version first, so a write that lands during the query leaves the memo already stale
+            version = self._write_version
+            stmt = select(Task).where(_INCOMPLETE).order_by(Task.priority.desc()).limit(1)
+            with self._get_session(conn) as session:
+                task = session.execute(stmt).scalar_one_or_none()
+            if task is not None and memoize:
+                memo.task = (version, task)
         if task is None:
             raise Exception("No incomplete tasks found")
         return task
 
-    def complete_tasks_for_goal(self, goal_id):
+    def get_highest_priority_id(self, conn=None):
+        """
+        Retrieve only the ID of the highest priority incomplete task, without loading the task itself.
+
+        Args:
+            conn (Connection, optional): An open connection whose transaction should be reused.
+
+        Returns:
+            int: The ID of the highest priority task, or None if no incomplete tasks are found.
+        """
+        stmt = select(Task.id).where(_INCOMPLETE).order_by(Task.priority.desc()).limit(1)
+        with self._get_session(conn) as session:
+            return session.execute(stmt).scalar_one_or_none()
+
+    def solve_highest_priority_task(self):
+        """
+        Retrieve the highest priority incomplete task so that it can be solved next.
+
+        Returns:
+            Task: The highest priority task.
+
+        Raises:
+            Exception: If no incomplete tasks are found.
+        """
+        return self.get_highest_priority_task()
+
+    def complete_tasks_for_goal(self, goal_id, conn=None):
         """
         Complete all tasks associated with a single goal.
 
         Args:
             goal_id (int): The ID of the goal.
+            conn (Connection, optional): An open connection whose transaction should be reused.
 
         Raises:
             Exception: If no tasks are found for the goal or the update fails.
         """
-        session = self.Session()
-        tasks = session.query(Task).filter_by(goal_id=goal_id).all()
-        if tasks is None:
+        try:
+            with self._connection(conn) as conn:
+                result = conn.execute(update(Task).where(Task.goal_id == goal_id).values(completed=1))
+        except Exception as e:
+            raise Exception("Failed to complete tasks for goal: " + str(e))
+        if result.rowcount == 0:
             raise Exception(f"No tasks found for goal id {goal_id}")
-        for task in tasks:
-            try:
-                task.completed = True
-                session.commit()
-            except Exception as e:
-                session.rollback()
-                raise Exception("Failed to complete tasks for goal: " + str(e))
 
     def update_goals_for_overall_goal(self, overall_goal_id):
         """
@@ -0,0 +1,115 @@
+import pytest
+from sqlalchemy import create_engine, select, text
+
+from auto_gpt_planner_plugin.database import DatabaseManager, DirtyPlan, Plan, Task
+from auto_gpt_planner_plugin.tasks import TaskManager
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def database_manager(engine):
+    return DatabaseManager(engine)
+
+
+@pytest.fixture
+def task_manager(engine):
+    return TaskManager(engine)
+
+
+def _dirty_plans(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(DirtyPlan.plan_id).order_by(DirtyPlan.plan_id)).scalars().all()
+
+
+def _clear_dirty_plans(engine):
+    with engine.begin() as conn:
+        conn.execute(DirtyPlan.__table__.delete())
+
+
+def test_get_task_returns_a_copy_of_the_cached_row(database_manager):
+    database_manager.create_task(Task(description="a", priority=1))
+    task = database_manager.get_task(1)
+    task.description = "changed"
+    assert database_manager.get_task(1).description == "a"
+    assert database_manager.get_task(1) is not database_manager.get_task(1)
+
+
+def test_get_plan_returns_a_copy_of_the_cached_row(database_manager):
+    database_manager.create_plan(Plan(goal="g"))
+    plan = database_manager.get_plan(1)
+    plan.goal = "changed"
+    assert database_manager.get_plan(1).goal == "g"
+
+
+def test_task_cache_is_cleared_by_writes_through_the_task_manager(database_manager, task_manager):
+    task_manager.create_task(Task(description="a", priority=1))
+    assert database_manager.get_task(1).completed == 0
+
+    task_manager.mark_task_complete(1)
+    assert database_manager.get_task(1).completed == 1
+    task_manager.update_tasks([{"id": 1, "description": "b"}])
+    assert database_manager.get_task(1).description == "b"
+    task_manager.delete_task(1)
+    assert database_manager.get_task(1) is None
+
+
+def test_caches_are_cleared_by_textual_sql_writes(engine, database_manager):
+    database_manager.create_task(Task(description="a", priority=1))
+    database_manager.create_plan(Plan(goal="g"))
+    assert database_manager.get_task(1).priority == 1
+    assert database_manager.get_plan(1).goal == "g"
+
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE tasks SET priority = 5"))
+        conn.execute(text("UPDATE plans SET goal = 'h'"))
+    assert database_manager.get_task(1).priority == 5
+    assert database_manager.get_plan(1).goal == "h"
+
+
+def test_caches_keep_their_rows_when_a_write_is_rolled_back(engine, database_manager):
+    database_manager.create_task(Task(description="a", priority=1))
+    database_manager.get_task(1)
+    with engine.connect() as conn:
+        with conn.begin() as transaction:
+            conn.execute(text("UPDATE tasks SET priority = 5"))
+            transaction.rollback()
+    assert database_manager.get_task(1).priority == 1
+
+
+def test_dirty_plans_triggers_record_the_plans_of_changed_tasks(engine, database_manager, task_manager):
+    database_manager.create_plan(Plan(goal="g"))
+    database_manager.create_plan(Plan(goal="h"))
+    # Inserting a plan marks it dirty
+    assert _dirty_plans(engine) == [1, 2]
+
+    _clear_dirty_plans(engine)
+    task_manager.create_tasks([Task(description="a", priority=1, plan_id=1), Task(description="b", priority=2)])
+    assert _dirty_plans(engine) == [1]
+
+    _clear_dirty_plans(engine)
+    # Moving a task to another plan marks both plans dirty
+    task_manager.update_tasks([{"id": 1, "plan_id": 2}])
+    assert _dirty_plans(engine) == [1, 2]
+
+    _clear_dirty_plans(engine)
+    task_manager.delete_task(1)
+    assert _dirty_plans(engine) == [2]
+
+
+def test_update_goals_only_rechecks_dirty_plans(engine, database_manager, task_manager):
+    database_manager.create_plan(Plan(goal="g"))
+    task_manager.create_tasks([Task(description="a", priority=1, plan_id=1), Task(description="b", priority=2, plan_id=1)])
+    assert database_manager.update_goals() == 0
+    assert _dirty_plans(engine) == []
+
+    task_manager.mark_tasks_complete([1, 2])
+    assert _dirty_plans(engine) == [1]
+    assert database_manager.update_goals() == 1
+    assert database_manager.get_plan(1).completed is True
+    assert _dirty_plans(engine) == []
@@ -0,0 +1,58 @@
+import pytest
+
+from auto_gpt_planner_plugin import llm_cache as llm_cache_module
+from auto_gpt_planner_plugin.llm_cache import LLMCache
+
+
+def test_make_key_only_depends_on_the_request():
+    messages = [{"role": "user", "content": "plan"}]
+    key = LLMCache.make_key("model", messages, 0, 100)
+    assert key == LLMCache.make_key("model", [{"content": "plan", "role": "user"}], 0.0, 100)
+    assert key != LLMCache.make_key("model", messages, 0, 200)
+    assert key != LLMCache.make_key("other", messages, 0, 100)
+
+
+def test_get_counts_hits_and_misses():
+    cache = LLMCache()
+    assert cache.get("a") is None
+    cache.set("a", "response")
+    assert cache.get("a") == "response"
+    assert cache.stats == {"hits": 1, "misses": 1}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LLMCache(maxsize=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    # Reading "a" makes "b" the least recently used entry
+    cache.get("a")
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_setting_an_existing_key_refreshes_it():
+    cache = LLMCache(maxsize=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.set("a", "updated")
+    cache.set("c", "3")
+    assert cache.get("a") == "updated"
+    assert cache.get("b") is None
+
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(llm_cache_module.time, "monotonic", lambda: now[0])
+    cache = LLMCache()
+    cache.set("a", "1", ttl=10)
+    cache.set("b", "2")
+    now[0] += 11
+    assert cache.get("a") is None
+    assert cache.get("b") == "2"
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        LLMCache(backend="memcached")
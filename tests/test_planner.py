@@ -0,0 +1,204 @@
+import json
+import re
+
+import pytest
+from sqlalchemy import create_engine, event, select
+
+from auto_gpt_planner_plugin import database as database_module
+from auto_gpt_planner_plugin import planner as planner_module
+from auto_gpt_planner_plugin.database import Task
+from auto_gpt_planner_plugin.planner import Planner
+
+
+class _Object(dict):
+    """A dictionary whose keys can also be read as attributes, like the openai package's response objects."""
+    __getattr__ = dict.__getitem__
+
+
+def _response(content, finish_reason="stop"):
+    return _Object(choices=[_Object(finish_reason=finish_reason, message=_Object(content=content))])
+
+
+class FakeChatCompletion:
+    """Answers plan requests with a fixed plan and solve requests with a solution per task."""
+
+    def __init__(self, plan="", fence=False, rate_limited=0):
+        self.plan = plan
+        self.fence = fence
+        self.rate_limited = rate_limited
+        self.plan_requests = []
+        self.solve_requests = []
+
+    def create(self, messages, **kwargs):
+        if messages[0]["content"] != planner_module._SOLVE_BATCH_PROMPT:
+            self.plan_requests.append(messages)
+            return _response(self.plan)
+        ids = [int(task_id) for task_id in re.findall(r"\[id (\d+)\]", messages[1]["content"])]
+        self.solve_requests.append(ids)
+        content = json.dumps([{"id": task_id, "solution": f"solution {task_id}"} for task_id in ids])
+        if self.fence:
+            content = f"```json\n{content}\n```"
+        return _response(content)
+
+    async def acreate(self, **kwargs):
+        if self.rate_limited:
+            self.rate_limited -= 1
+            raise planner_module.openai.error.RateLimitError("Rate limit reached")
+        return self.create(**kwargs)
+
+
+@pytest.fixture
+def planner(monkeypatch):
+    monkeypatch.delenv("PLANNER_USE_BATCH_API", raising=False)
+    engine = create_engine("sqlite://")
+    yield Planner(engine)
+    engine.dispose()
+
+
+def _tasks(planner):
+    with planner.engine.connect() as conn:
+        return conn.execute(select(Task.description, Task.priority, Task.completed).order_by(Task.id)).all()
+
+
+def test_initial_planning_cycle_creates_and_completes_the_plans_tasks(planner, monkeypatch):
+    planner.task_manager.create_task(Task(description="Research", priority=1))
+    plan = "# Plan\n\n- [ ] Research\n- [ ] Write the draft\n- [x] Pick a topic\n"
+    chat = FakeChatCompletion(plan)
+    monkeypatch.setattr(planner_module.openai, "ChatCompletion", chat)
+
+    assert planner.run_initial_planning_cycle(["Write a report"]) == plan.strip()
+    assert _tasks(planner) == [("Research", 1, 1), ("Write the draft", 2, 1), ("Pick a topic", 1, 1)]
+    # Both incomplete tasks were solved by one request
+    assert [sorted(ids) for ids in chat.solve_requests] == [[1, 2]]
+
+
+def test_complete_tasks_skips_tasks_solved_by_an_earlier_cycle(planner, monkeypatch):
+    chat = FakeChatCompletion()
+    monkeypatch.setattr(planner_module.openai, "ChatCompletion", chat)
+    planner.task_manager.create_task(Task(description="a", priority=1))
+    assert planner.complete_tasks(planner.task_manager.get_incomplete_tasks()) == {1: "solution 1"}
+
+    planner.task_manager.create_task(Task(description="a", priority=1))
+    assert planner.complete_tasks(planner.task_manager.get_incomplete_tasks()) == {}
+    assert chat.solve_requests == [[1]]
+    assert [completed for _, _, completed in _tasks(planner)] == [1, 1]
+
+
+def test_generate_tasks_mixes_tasks_with_and_without_ids(planner):
+    planner.generate_tasks([
+        {"id": 5, "description": "a", "priority": 1, "completed": False},
+        {"id": None, "description": "b", "priority": 2, "completed": True},
+    ])
+    with planner.engine.connect() as conn:
+        assert conn.execute(select(Task.id, Task.description, Task.completed).order_by(Task.id)).all() == [
+            (5, "a", 0), (6, "b", 1),
+        ]
+
+
+def test_generate_plan_only_looks_up_a_similar_plan_when_the_caches_miss(planner, monkeypatch):
+    chat = FakeChatCompletion("- [ ] plan")
+    monkeypatch.setattr(planner_module.openai, "ChatCompletion", chat)
+    lookups = []
+
+    def find_similar_plan():
+        lookups.append(1)
+        return None
+
+    assert planner.generate_plan(["a goal"], cached_plan=find_similar_plan) == "- [ ] plan"
+    assert planner.generate_plan(["a goal"], cached_plan=find_similar_plan) == "- [ ] plan"
+    assert lookups == [1]
+
+
+def test_generate_plan_sends_the_task_checklist_once(planner, monkeypatch):
+    chat = FakeChatCompletion("- [ ] plan")
+    monkeypatch.setattr(planner_module.openai, "ChatCompletion", chat)
+    planner.task_manager.create_task(Task(description="Research", priority=1))
+
+    planner.generate_plan(["a goal"])
+    content = chat.plan_requests[0][-1]["content"]
+    assert content.count("Research") == 1
+    assert "Task Status" not in content
+
+
+def _incomplete(planner, count):
+    planner.task_manager.create_tasks([Task(description=f"task {index}", priority=index) for index in range(count)])
+    return planner.task_manager.get_incomplete_tasks()
+
+
+def test_solve_tasks_batch_parses_a_fenced_reply(planner, monkeypatch):
+    monkeypatch.setattr(planner_module.openai, "ChatCompletion", FakeChatCompletion(fence=True))
+    assert planner.solve_tasks_batch(_incomplete(planner, 2)) == {1: "solution 1", 2: "solution 2"}
+
+
+def test_solve_tasks_batch_splits_the_tasks_to_fit_the_token_limit(planner, monkeypatch):
+    chat = FakeChatCompletion()
+    monkeypatch.setattr(planner_module.openai, "ChatCompletion", chat)
+    planner._max_tokens = 2 * planner_module._SOLVE_TOKENS_PER_TASK
+
+    assert planner.solve_tasks_batch(_incomplete(planner, 5)) == {task_id: f"solution {task_id}" for task_id in range(1, 6)}
+    assert sorted(len(ids) for ids in chat.solve_requests) == [1, 2, 2]
+
+
+def test_solve_tasks_batch_rejects_a_truncated_reply(planner, monkeypatch):
+    chat = FakeChatCompletion()
+    chat.create = lambda messages, **kwargs: _response("[{", finish_reason="length")
+    monkeypatch.setattr(planner_module.openai, "ChatCompletion", chat)
+    with pytest.raises(Exception, match="exceeded the token limit"):
+        planner.solve_tasks_batch(_incomplete(planner, 1))
+
+
+def test_solve_tasks_batch_backs_off_when_rate_limited(planner, monkeypatch):
+    chat = FakeChatCompletion(rate_limited=2)
+    monkeypatch.setattr(planner_module.openai, "ChatCompletion", chat)
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(planner_module.asyncio, "sleep", sleep)
+    assert planner.solve_tasks_batch(_incomplete(planner, 1)) == {1: "solution 1"}
+    assert delays == [1, 2]
+
+
+def test_solved_signatures_confirms_filter_hits_with_one_query_per_batch(planner, monkeypatch):
+    monkeypatch.setattr(database_module, "_SIGNATURE_BATCH_SIZE", 2)
+    database_manager = planner.database_manager
+    database_manager.record_solved_tasks(["a", "b", "c"])
+    # Stand in for a bloom filter with false positives for "x" and "y"
+    database_manager._solved_filter.update(["x", "y"])
+    monkeypatch.setattr(database_module, "ScalableBloomFilter", object)
+    statements = []
+    event.listen(planner.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    assert database_manager.solved_signatures(["a", "c", "x", "y", "z"]) == {"a", "c"}
+    assert len([statement for statement in statements if "completed_tasks" in statement]) == 2
+
+
+def test_rewrite_plan_substitutes_goals_and_tasks():
+    plan = "# Plan\n\n## Goals:\n1. Write a report\n\n- [ ] Research\n- [ ] Write the draft\n"
+    rewritten = planner_module._rewrite_plan(
+        plan,
+        ["Write a report"], ["Write an essay"],
+        [("Research", False), ("Write the draft", False)], [("Read", True), ("Write the essay", False)],
+    )
+    assert rewritten == "# Plan\n\n## Goals:\n1. Write an essay\n\n- [x] Read\n- [ ] Write the essay\n"
+
+
+def test_rewrite_plan_does_not_rewrite_substituted_text_again():
+    # "a" becomes "b" while "b" becomes "c"; a second pass would turn both into "c"
+    rewritten = planner_module._rewrite_plan("- [ ] a\n- [ ] b\n", [], [], [("a", False), ("b", False)], [("b", False), ("c", False)])
+    assert rewritten == "- [ ] b\n- [ ] c\n"
+
+
+def test_rewrite_plan_updates_the_checklist_status():
+    rewritten = planner_module._rewrite_plan("- [x] Research\n- [ ] Draft\n", [], [], [], [("Research", False), ("Draft", True)])
+    assert rewritten == "- [ ] Research\n- [x] Draft\n"
+
+
+def test_generate_plan_reuses_the_plan_of_a_matching_template(planner, monkeypatch):
+    chat = FakeChatCompletion("## Goals:\n1. Write a short report")
+    monkeypatch.setattr(planner_module.openai, "ChatCompletion", chat)
+
+    planner.generate_plan(["Write a short report"])
+    assert planner.generate_plan(["Write a short report today"]) == "## Goals:\n1. Write a short report today"
+    assert len(chat.plan_requests) == 1
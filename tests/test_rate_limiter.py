@@ -0,0 +1,16 @@
+from auto_gpt_planner_plugin.rate_limiter import RateLimiter
+
+
+def test_reserve_spends_both_buckets_and_reports_the_wait():
+    limiter = RateLimiter(max_requests_per_minute=2, max_tokens_per_minute=600)
+    assert limiter._reserve(250) == 0
+    assert limiter._reserve(250) == 0
+    # Out of requests: one refills every 30 seconds
+    assert 29 < limiter._reserve(10) <= 30
+
+
+def test_reserve_waits_for_tokens():
+    limiter = RateLimiter(max_requests_per_minute=100, max_tokens_per_minute=600)
+    assert limiter._reserve(500) == 0
+    # 100 tokens left, 300 more needed at 10 per second
+    assert 29 < limiter._reserve(400) <= 30
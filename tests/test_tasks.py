@@ -0,0 +1,145 @@
+import pytest
+from sqlalchemy import create_engine, insert, select, text
+
+from auto_gpt_planner_plugin.database import DirtyPlan, Plan, Task
+from auto_gpt_planner_plugin.tasks import TaskManager, TaskNotFound
+
+
+@pytest.fixture
+def task_manager():
+    manager = TaskManager("sqlite://")
+    yield manager
+    manager.close()
+
+
+def _rows(task_manager):
+    with task_manager.engine.connect() as conn:
+        return [tuple(row) for row in conn.execute(
+            select(Task.id, Task.description, Task.priority, Task.completed).order_by(Task.id)
+        )]
+
+
+def test_create_tasks_mixes_tasks_with_and_without_ids(task_manager):
+    task_manager.create_tasks([
+        Task(description="a", priority=1),
+        Task(id=10, description="b", priority=2, completed=1),
+        {"description": "c", "priority": 3},
+    ])
+    rows = _rows(task_manager)
+    assert len(rows) == 3
+    assert (10, "b", 2, 1) in rows
+    assert {row[1] for row in rows if row[0] != 10} == {"a", "c"}
+    assert all(row[3] == 0 for row in rows if row[0] != 10)
+
+
+def test_create_task_sets_the_new_id(task_manager):
+    first = Task(description="a", priority=1)
+    assert task_manager.create_task(first) == 1
+    assert first.id == 1
+    assert task_manager.create_task({"description": "b", "priority": 2}) == 2
+    assert task_manager.get_task(first.id).description == "a"
+
+
+def test_create_tasks_within_a_shared_transaction_rolls_back(task_manager):
+    with pytest.raises(RuntimeError):
+        with task_manager.transaction() as conn:
+            task_manager.create_tasks([Task(description="a", priority=1)], conn=conn)
+            raise RuntimeError
+    assert _rows(task_manager) == []
+
+
+def test_upsert_tasks_inserts_and_overwrites(task_manager):
+    task_manager.create_tasks([Task(description="a", priority=1), Task(description="b", priority=2)])
+    task_manager.upsert_tasks([
+        {"id": 1, "description": "A", "priority": 5},
+        {"id": 2, "completed": 1},
+        {"id": 3, "description": "c", "priority": 3},
+    ])
+    assert _rows(task_manager) == [(1, "A", 5, 0), (2, "b", 2, 1), (3, "c", 3, 0)]
+
+
+def test_upsert_tasks_leaves_unset_task_attributes_alone(task_manager):
+    task_manager.create_task(Task(description="a", priority=1, goal_id=7))
+    task_manager.upsert_tasks([Task(id=1, priority=5), Task(id=2, description="b", priority=2)])
+    assert _rows(task_manager) == [(1, "a", 5, 0), (2, "b", 2, 0)]
+    assert task_manager.get_task(1).goal_id == 7
+
+
+def test_upsert_tasks_of_a_plan(task_manager):
+    # The dirty_plans triggers fire inside the UPSERT, whose conflict clause overrides INSERT OR IGNORE in them
+    with task_manager.transaction() as conn:
+        conn.execute(insert(Plan).values(id=1, goal="g"))
+    task_manager.create_task(Task(description="a", priority=1, plan_id=1))
+    task_manager.upsert_tasks([{"id": 1, "completed": 1}, {"id": 2, "description": "b", "priority": 2, "plan_id": 1}])
+    assert _rows(task_manager) == [(1, "a", 1, 1), (2, "b", 2, 0)]
+    with task_manager.engine.connect() as conn:
+        assert conn.execute(select(DirtyPlan.plan_id)).scalars().all() == [1]
+
+
+def test_update_tasks(task_manager):
+    task_manager.create_tasks([Task(description="a", priority=1), Task(description="b", priority=2)])
+    task_manager.update_tasks([{"id": 1, "priority": 7}, {"id": 2, "description": "B", "completed": 1}])
+    assert _rows(task_manager) == [(1, "a", 7, 0), (2, "B", 2, 1)]
+
+
+def test_delete_tasks_returns_the_number_deleted(task_manager):
+    task_manager.create_tasks([Task(description=str(i), priority=i) for i in range(5)])
+    assert task_manager.delete_tasks([1, 3, 99]) == 2
+    assert [row[0] for row in _rows(task_manager)] == [2, 4, 5]
+    assert task_manager.delete_tasks([]) == 0
+
+
+def test_mark_tasks_complete_returns_the_number_updated(task_manager):
+    task_manager.create_tasks([Task(description=str(i), priority=i) for i in range(3)])
+    assert task_manager.mark_tasks_complete(iter([1, 2, 42])) == 2
+    assert [row[3] for row in _rows(task_manager)] == [1, 1, 0]
+    assert [task.id for task in task_manager.get_incomplete_tasks()] == [3]
+
+
+def test_highest_priority_task_follows_writes(task_manager):
+    task_manager.create_tasks([Task(description="low", priority=1), Task(description="high", priority=5)])
+    with task_manager.request():
+        high = task_manager.get_highest_priority_task()
+        assert high.description == "high"
+        assert task_manager.get_highest_priority_task() is high
+        task_manager.mark_task_complete(2)
+        assert task_manager.get_highest_priority_task().description == "low"
+        task_manager.create_task(Task(description="urgent", priority=9))
+        assert task_manager.get_highest_priority_task().description == "urgent"
+        with task_manager.engine.begin() as conn:
+            conn.execute(text("UPDATE tasks SET completed = 1 WHERE priority = 9"))
+        assert task_manager.get_highest_priority_task().description == "low"
+
+
+def test_highest_priority_task_is_not_memoized_outside_a_request(tmp_path):
+    url = f"sqlite:///{tmp_path / 'tasks.db'}"
+    task_manager = TaskManager(url)
+    other_engine = create_engine(url)
+    try:
+        task_manager.create_task(Task(description="a", priority=1))
+        assert task_manager.get_highest_priority_task().description == "a"
+        # A write this process's engine never sees, as from another process
+        with other_engine.begin() as conn:
+            conn.execute(text("INSERT INTO tasks (description, priority, completed) VALUES ('b', 5, 0)"))
+        assert task_manager.get_highest_priority_task().description == "b"
+    finally:
+        other_engine.dispose()
+        task_manager.close()
+
+
+def test_single_task_paths_raise_task_not_found(task_manager):
+    with pytest.raises(TaskNotFound) as excinfo:
+        task_manager.get_task(1)
+    assert excinfo.value.task_id == 1
+    with pytest.raises(TaskNotFound):
+        task_manager.mark_task_complete(1)
+    with pytest.raises(TaskNotFound):
+        task_manager.delete_task(1)
+    with pytest.raises(TaskNotFound):
+        task_manager.update_task(Task(id=1, priority=2))
+
+
+def test_update_task_without_columns_raises(task_manager):
+    task_manager.create_task(Task(description="a", priority=1))
+    with pytest.raises(ValueError):
+        task_manager.update_task(Task(id=1))